@@ -0,0 +1,195 @@
+import sys, json, time, math, threading, itertools, logging, urllib.request
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+#Long running backtest server so what-if runs skip the cold start of importing pandas and the trading library, loading price histories and building signals.
+#Jobs run in a pool of worker processes that stay up between jobs.  Each worker attaches the shared price panel once and keeps everything it computes:
+#the momentum signal matrices, the panels of other universes and the BuyHold baseline cache.  The server builds the shared panel's cache before starting
+#the workers so they only map it, and starts a new pool when a worker dies and breaks the old one.  Only the last maxJobs jobs are kept, the oldest
+#finished ones are dropped first.
+#HTTP API on localhost, every body is json:
+#  POST /run     {"jobs":[{"strategy":"RunPriceMomentum", "params":{...}}, ...]} queues the jobs and streams one json line per job as each completes
+#  POST /jobs    same body, returns the job ids straight away
+#  GET  /jobs    status of every job, GET /jobs/<id> one job with its result once done
+#  GET  /status  strategies, workers and job counts
+#strategy is one of jobStrategies, params are the keyword arguments of that function in PriceMomentumTraderNew.  A tickerList given as a name such as
+#"SPTop70" is taken from TickerLists.  DataFrame results are returned in pandas split orientation.
+defaultPort = 8765
+jobStrategies = ['RunBuyHold', 'RunBuyHoldList', 'RunPriceMomentum', 'RunPriceMomentumBlended', 'RunPointValue', 'ComparePMToBH', 'CompareBlendedToBH', 'ComparePVToBH', 'CompareStrategiesToBH', 'WalkForwardPMToBH', 'MonteCarloPMToBH']
+
+def _WarmWorker(sharedPrices:bool=False):
+	#Runs once in each worker process
+	import PriceMomentumTraderNew as trader
+	from BaselineCache import GetBaselineCache
+	trader.ConfigureLogging(logging.WARNING)
+	if sharedPrices: trader.UseSharedPrices()
+	GetBaselineCache()
+
+def _JsonValue(value):
+	if isinstance(value, (pd.DataFrame, pd.Series)): return json.loads(value.to_json(orient='split', date_format='iso'))
+	if isinstance(value, np.generic): value = value.item()
+	if isinstance(value, float) and not math.isfinite(value): return None
+	return value
+
+def _RunJob(strategy:str, params:dict):
+	import PriceMomentumTraderNew as trader
+	from _classes.TickerLists import TickerLists
+	params = dict(params)
+	if isinstance(params.get('tickerList'), str): params['tickerList'] = getattr(TickerLists, params['tickerList'])()
+	start = time.perf_counter()
+	result = getattr(trader, strategy)(**params)
+	return _JsonValue(result), time.perf_counter() - start
+
+class BacktestServer():
+	def __init__(self, host:str='127.0.0.1', port:int=defaultPort, workers:int=2, maxJobs:int=1000, sharedPrices:bool=False):
+		#sharedPrices serves every job's histories from the price panel, opt in like --sharedPrices in PriceMomentumTraderNew
+		import PriceMomentumTraderNew as trader
+		self.host = host
+		self.port = port
+		self.workers = workers
+		self.maxJobs = maxJobs
+		self.sharedPrices = sharedPrices
+		if sharedPrices: trader.UseSharedPrices()
+		self.pool = self._CreatePool()
+		self.jobs = {}
+		self._ids = itertools.count(1)
+		self._lock = threading.Lock()
+
+	def _CreatePool(self): return ProcessPoolExecutor(max_workers=self.workers, initializer=_WarmWorker, initargs=(self.sharedPrices,))
+
+	def Submit(self, strategy:str, params:dict=None):
+		#Queues one job and returns its id, unknown strategies raise ValueError
+		return self._Submit(strategy, params)['id']
+
+	def _Submit(self, strategy:str, params:dict=None):
+		#Returns the job record, which stays valid after the job is dropped from jobs
+		if not strategy in jobStrategies: raise ValueError('Unknown strategy ' + str(strategy))
+		params = params or {}
+		with self._lock:
+			jobId = next(self._ids)
+			job = {'id':jobId, 'strategy':strategy, 'params':params, 'status':'queued', 'submitted':time.time()}
+			try:
+				job['future'] = self.pool.submit(_RunJob, strategy, params)
+			except BrokenProcessPool: #A worker died, the jobs it had were failed by the pool, start a new one for this and later jobs
+				self.pool.shutdown(wait=False, cancel_futures=True)
+				self.pool = self._CreatePool()
+				job['future'] = self.pool.submit(_RunJob, strategy, params)
+			self.jobs[jobId] = job
+			self._DropOldJobs()
+		job['future'].add_done_callback(lambda future: self._Finished(job, future))
+		return job
+
+	def _DropOldJobs(self):
+		#Called holding the lock, jobs are in id order so the first finished ones are the oldest
+		excess = len(self.jobs) - self.maxJobs
+		for jobId in [jobId for jobId, job in self.jobs.items() if job['future'].done()][:max(0, excess)]:
+			del self.jobs[jobId]
+
+	def _Outcome(self, future):
+		#Status and result or error of a done future
+		try:
+			result, seconds = future.result()
+			return {'status':'done', 'result':result, 'seconds':seconds}
+		except Exception as e:
+			return {'status':'failed', 'error':repr(e)}
+
+	def _Finished(self, job:dict, future):
+		outcome = self._Outcome(future)
+		with self._lock:
+			job.update(outcome)
+			job['finished'] = time.time()
+
+	def Job(self, jobId:int): return self._Record(self.jobs[jobId])
+
+	def _Record(self, job:dict):
+		#Job record without the future, the status comes from the future so it is complete even before _Finished has run.  Running is as close as the pool lets us tell
+		with self._lock:
+			record = {k:v for k, v in job.items() if k != 'future'}
+		future = job['future']
+		if future.done(): record.update(self._Outcome(future))
+		elif future.running(): record['status'] = 'running'
+		return record
+
+	def Status(self):
+		statuses = [self._Record(job)['status'] for job in list(self.jobs.values())]
+		return {'strategies':jobStrategies, 'workers':self.workers, 'jobs':{s:statuses.count(s) for s in ['queued','running','done','failed']}}
+
+	def Serve(self):
+		httpServer = ThreadingHTTPServer((self.host, self.port), _Handler)
+		httpServer.backtest = self
+		print('Backtest server on http://' + self.host + ':' + str(self.port) + ' with ' + str(self.workers) + ' workers')
+		try:
+			httpServer.serve_forever()
+		except KeyboardInterrupt:
+			pass
+		finally:
+			httpServer.server_close()
+			self.pool.shutdown(wait=False, cancel_futures=True)
+
+class _Handler(BaseHTTPRequestHandler):
+	def _Send(self, status:int, body):
+		data = json.dumps(body).encode()
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def _Jobs(self):
+		#Accepts {"jobs":[...]} or a single job
+		body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+		jobs = body['jobs'] if 'jobs' in body else [body]
+		return [self.server.backtest._Submit(job.get('strategy'), job.get('params')) for job in jobs]
+
+	def do_GET(self):
+		backtest = self.server.backtest
+		parts = self.path.strip('/').split('/')
+		if parts == ['status']: return self._Send(200, backtest.Status())
+		if parts == ['jobs']: return self._Send(200, [{k:v for k, v in backtest._Record(job).items() if k != 'result'} for job in list(backtest.jobs.values())])
+		job = backtest.jobs.get(int(parts[1])) if len(parts) == 2 and parts[0] == 'jobs' and parts[1].isdigit() else None
+		if job is not None: return self._Send(200, backtest._Record(job))
+		self._Send(404, {'error':'Not found ' + self.path})
+
+	def do_POST(self):
+		try:
+			jobs = self._Jobs()
+		except (ValueError, KeyError, TypeError, AttributeError) as e:
+			return self._Send(400, {'error':repr(e)})
+		except RuntimeError as e: #BrokenProcessPool is one, the new pool broke too
+			return self._Send(503, {'error':repr(e)})
+		if self.path.rstrip('/') == '/jobs': return self._Send(202, {'jobs':[job['id'] for job in jobs]})
+		if self.path.rstrip('/') != '/run': return self._Send(404, {'error':'Not found ' + self.path})
+		#Streams one line per job in completion order, the response ends when the last job does
+		backtest = self.server.backtest
+		finished = threading.Semaphore(0)
+		for job in jobs: job['future'].add_done_callback(lambda future: finished.release())
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/x-ndjson')
+		self.end_headers()
+		sent = set()
+		while len(sent) < len(jobs):
+			finished.acquire()
+			for job in jobs:
+				if not job['id'] in sent and job['future'].done():
+					self.wfile.write((json.dumps(backtest._Record(job)) + '\n').encode())
+					self.wfile.flush()
+					sent.add(job['id'])
+
+	def log_message(self, format, *args): pass
+
+def RunRemote(jobs:list, host:str='127.0.0.1', port:int=defaultPort):
+	#Client side: sends [{"strategy":..., "params":{...}}, ...] to a running server and yields each job's record as it completes
+	request = urllib.request.Request('http://' + host + ':' + str(port) + '/run', data=json.dumps({'jobs':jobs}).encode(), headers={'Content-Type':'application/json'})
+	with urllib.request.urlopen(request) as response:
+		for line in response:
+			yield json.loads(line)
+
+if __name__ == '__main__':
+	#python BacktestServer.py [port] [workers] [--sharedPrices]
+	args = [a for a in sys.argv[1:] if not a.startswith('--')]
+	port = int(args[0]) if len(args) > 0 else defaultPort
+	workers = int(args[1]) if len(args) > 1 else 2
+	BacktestServer(port=port, workers=workers, sharedPrices='--sharedPrices' in sys.argv).Serve()
@@ -0,0 +1,87 @@
+import os, json
+import numpy as np
+from _classes.Utility import *
+from PricePanel import GetPricePanel, PanelPricingData, SourceFileVersion, historicalFolder
+from Profiling import logger
+
+#Buy and hold baselines memoized on disk, so repeated Compare runs and sweeps never simulate the benchmark again.
+#Model memoizes the ending value of the TradingModel baseline itself (RunBuyHoldMemo in the trader scripts, the default baseline), keyed by the function,
+#its inputs and the version of the ticker's price file, so it returns exactly what running the model again on the same prices would.
+#BuyHold computes the baseline straight from the price series instead (RunBuyHoldCached, opt in), keyed by ticker, start date, duration, portfolio size
+#and the version of the ticker's price file.  A refreshed price file gives new baselines for both.
+#Fills match RunBuyHold: ten tranches of portfolioSize/10 are ordered at the first day's close and filled at the next open, then held and sold at the last day's open like CloseModel.
+#ReEvaluationInterval is not part of the key, every tranche is bought on the first day so RunBuyHold never buys again.
+baselineFile = 'data/baseline/BuyHold.json'
+baselineVersion = '2' #Part of the key, changed whenever BuyHoldFromPrices fills differently so values saved before aren't reused
+
+def BuyHoldFromPrices(panel, ticker:str, startDate, durationInYears:int, portfolioSize:float=30000):
+	i = panel.TickerIndex(ticker)
+	if i < 0: return 0
+	i0, i1 = panel.DateRange(startDate, AddDays(ToDate(startDate), 365 * durationInYears))
+	close = panel.fields['Close'][i, i0:i1]
+	openPrices = panel.fields['Open'][i, i0:i1]
+	valid = np.flatnonzero(~np.isnan(close))
+	if len(valid) < 2: return 0
+	orderPrice = close[valid[0]]
+	fillPrice = openPrices[valid[1]]
+	if not fillPrice > 0: fillPrice = close[valid[1]]
+	tranchSize = portfolioSize/10
+	units = min(10 * np.round(tranchSize / orderPrice), np.floor(portfolioSize / fillPrice))
+	cash = portfolioSize - units * fillPrice
+	sellPrice = openPrices[valid[-1]]
+	if not sellPrice > 0: sellPrice = close[valid[-1]]
+	return float(cash + units * sellPrice)
+
+class BaselineCache():
+	def __init__(self, fileName:str=baselineFile):
+		self._fileName = fileName
+		self._values = self._Read()
+
+	def _Read(self):
+		if not os.path.isfile(self._fileName): return {}
+		with open(self._fileName) as f: return json.load(f)
+
+	def _Save(self):
+		#Merge with entries other processes saved since we loaded, then replace the file in one step
+		values = self._Read()
+		values.update(self._values)
+		self._values = values
+		os.makedirs(os.path.dirname(self._fileName), exist_ok=True)
+		tempFile = self._fileName + '.' + str(os.getpid())
+		with open(tempFile, 'w') as f: json.dump(values, f, indent=0, sort_keys=True)
+		os.replace(tempFile, self._fileName)
+
+	def _Panel(self, ticker:str):
+		#Use the shared panel when it has the ticker, otherwise a panel of just this ticker
+		if PanelPricingData.panel is not None and PanelPricingData.panel.TickerIndex(ticker) >= 0: return PanelPricingData.panel
+		return GetPricePanel([ticker])
+
+	def Model(self, modelName:str, runBuyHold, ticker:str, startDate, durationInYears:int, ReEvaluationInterval:int=20, portfolioSize:float=30000):
+		#Ending value of runBuyHold, modelName names the function in the key.  Failed runs, which return 0, are not kept
+		def Key(): return '|'.join([modelName, ticker, str(ToDate(startDate).date()), str(durationInYears), str(ReEvaluationInterval), str(float(portfolioSize)), SourceFileVersion(historicalFolder + ticker + '.csv')])
+		if not Key() in self._values:
+			endingValue = runBuyHold(ticker, startDate=startDate, durationInYears=durationInYears, ReEvaluationInterval=ReEvaluationInterval, portfolioSize=portfolioSize)
+			if not endingValue: return endingValue
+			self._values[Key()] = float(endingValue) #Keyed after the run, which may have fetched the price file
+			self._Save()
+		return self._values[Key()]
+
+	def BuyHold(self, ticker:str, startDate, durationInYears:int, portfolioSize:float=30000):
+		panel = self._Panel(ticker)
+		key = '|'.join([baselineVersion, ticker, str(ToDate(startDate).date()), str(durationInYears), str(float(portfolioSize)), panel.tickerVersions.get(ticker, '')])
+		if not key in self._values:
+			self._values[key] = BuyHoldFromPrices(panel, ticker, startDate, durationInYears, portfolioSize)
+			self._Save()
+		return self._values[key]
+
+_cache = None
+def GetBaselineCache():
+	global _cache
+	if _cache is None: _cache = BaselineCache()
+	return _cache
+
+def RunBuyHoldCached(ticker:str, startDate:str, durationInYears:int, ReEvaluationInterval:int=20, portfolioSize:int=30000, verbose:bool=False):
+	#Same call as RunBuyHold, served from the baseline cache
+	endingValue = GetBaselineCache().BuyHold(ticker, startDate, durationInYears, portfolioSize)
+	logger.info('BuyHold ' + ticker + ' ' + str(startDate) + ' Ending Value: ' + str(endingValue))
+	return endingValue
@@ -0,0 +1,145 @@
+import os, sys, io, json, time, zlib, platform, subprocess, tracemalloc, contextlib
+import numpy as np
+import pandas as pd
+from _classes.TickerLists import TickerLists
+import PriceMomentumTraderNew as trader
+import PriceSignals, MonteCarlo, BaselineCache
+from PricePanel import GetPricePanel, AttachPricePanel, DetachPricePanel
+from PriceSignals import largeUniverseSize
+from Profiling import EnableProfiling, DisableProfiling, ProfileSummary
+
+#Offline benchmarks on deterministic synthetic price histories, so timings can be repeated on machines without market data.
+#The generated csv files go in a working folder laid out like the real one (data/historical/), the runs read them through the shared price panel
+#so nothing is downloaded.  Each scenario records wall time, peak traced memory and simulated trading days per second as one json line in outputFile,
+#tagged with the git commit so results from different commits can be compared with CompareBenchmarks.  The seconds spent in each profiling phase are recorded with it.
+#Wall time comes from a run without tracemalloc, which slows every allocation down.  Memory comes from a second, traced run, along with the process's peak
+#resident size from getrusage where the resource module exists.  Memoized signals, Monte Carlo histories and BuyHold baselines are cleared before both runs,
+#so neither reuses what an earlier run computed.  The price panel is built before timing starts and kept.
+benchmarkFolder = 'data/benchmark/'
+syntheticVersion = 2 #Part of the working folder name, changed whenever GenerateSyntheticHistory generates different prices
+syntheticStart = '1/1/1979'
+syntheticEnd = '12/31/2019'
+
+def GenerateSyntheticHistory(tickerList:list, folder:str, startDate:str=syntheticStart, endDate:str=syntheticEnd, seed:int=0, listingSpread:bool=False):
+	#Geometric random walk OHLC for each ticker, the same seed and ticker name always give the same prices whatever list the ticker is generated with.
+	#listingSpread makes some tickers list late and some delist early, like a real index universe.  It never applies to the .INX baseline
+	os.makedirs(folder, exist_ok=True)
+	dates = pd.bdate_range(startDate, endDate)
+	for ticker in tickerList:
+		fileName = folder + ticker + '.csv'
+		if os.path.isfile(fileName): continue
+		rng = np.random.default_rng([seed, zlib.crc32(ticker.encode())])
+		drift = rng.normal(0.0003, 0.0003)
+		volatility = rng.uniform(0.01, 0.03)
+		first, last = 0, len(dates)
+		if listingSpread and ticker != '.INX':
+			first = int(rng.integers(0, len(dates) // 2)) if rng.random() < 0.5 else 0
+			last = int(rng.integers(len(dates) // 2, len(dates))) if rng.random() < 0.2 else len(dates)
+		returns = rng.normal(drift, volatility, last - first)
+		close = 10 * np.exp(np.cumsum(returns))
+		openPrices = np.concatenate([[close[0]], close[:-1]]) * np.exp(rng.normal(0, volatility / 4, last - first))
+		high = np.maximum(openPrices, close) * (1 + np.abs(rng.normal(0, volatility / 2, last - first)))
+		low = np.minimum(openPrices, close) * (1 - np.abs(rng.normal(0, volatility / 2, last - first)))
+		volume = rng.integers(100000, 10000000, last - first)
+		prices = pd.DataFrame({'Open':openPrices, 'High':high, 'Low':low, 'Close':close, 'Volume':volume}, index=pd.Index(dates[first:last], name='Date'))
+		prices.round(4).to_csv(fileName)
+
+def _UniverseTickers(count:int): return ['SYN' + str(i).zfill(4) for i in range(count)]
+
+#name: (tickers, start, years, trials, run(tickers, engine)).  The engine is 'loop' for the TradingModel day loop, 'signals' for the loop with precomputed signals, 'vectorized' for the array engine with precomputed signals
+scenarios = {
+	'PriceMomentum36Year': (lambda: TickerLists.SPTop70(), '1/1/1982', 36, 1, lambda tickers, engine: trader.RunPriceMomentum(tickers, startDate='1/1/1982', durationInYears=36, stockCount=5, ReEvaluationInterval=20, filterOption=2, useSignals=engine!='loop', vectorized=engine=='vectorized')),
+	'Blended36Year': (lambda: TickerLists.SPTop70(), '1/1/1982', 36, 1, lambda tickers, engine: trader.RunPriceMomentumBlended(tickers, startDate='1/1/1982', durationInYears=36, ReEvaluationInterval=20, useSignals=engine!='loop', vectorized=engine=='vectorized')),
+	'PointValue36Year': (lambda: TickerLists.SPTop70(), '1/1/1982', 36, 1, lambda tickers, engine: trader.RunPointValue(tickers, startDate='1/1/1982', durationInYears=36, stockCount=5, ReEvaluationInterval=20, useSignals=engine!='loop', vectorized=engine=='vectorized')),
+	'ComparePM36Trials': (lambda: TickerLists.SPTop70(), '1/2/1982', 1, 36, lambda tickers, engine: trader.ComparePMToBH(startYear=1982, endYear=2018, durationInYears=1, stockCount=5, filterOption=2, useSignals=engine!='loop', vectorized=engine=='vectorized')),
+	'Universe70': (lambda: _UniverseTickers(70), '1/1/2008', 10, 1, lambda tickers, engine: trader.RunPriceMomentum(tickers, startDate='1/1/2008', durationInYears=10, stockCount=9, useSignals=engine!='loop', vectorized=engine=='vectorized')),
+	'Universe500': (lambda: _UniverseTickers(500), '1/1/2008', 10, 1, lambda tickers, engine: trader.RunPriceMomentum(tickers, startDate='1/1/2008', durationInYears=10, stockCount=9, useSignals=engine!='loop', vectorized=engine=='vectorized')),
+	'Universe3000': (lambda: _UniverseTickers(3000), '1/1/2008', 10, 1, lambda tickers, engine: trader.RunPriceMomentum(tickers, startDate='1/1/2008', durationInYears=10, stockCount=9, useSignals=engine!='loop', vectorized=engine=='vectorized')),
+}
+
+def _Commit():
+	try:
+		return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+	except OSError:
+		return ''
+
+def _ClearMemos():
+	#Run from the working folder, the baseline file removed is the benchmark's own
+	PriceSignals._momentumSignals.clear()
+	MonteCarlo._history = None
+	BaselineCache._cache = None
+	if os.path.isfile(BaselineCache.baselineFile): os.remove(BaselineCache.baselineFile)
+
+def _PeakResidentMB():
+	#High water mark of the process's resident memory, None where getrusage isn't available.  ru_maxrss is in KB on Linux and bytes on macOS
+	try:
+		import resource
+	except ImportError:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return round(peak / (2**20 if sys.platform == 'darwin' else 2**10), 2)
+
+def RunBenchmarks(scenarioNames:list=None, engines:list=None, seed:int=0, outputFile:str='benchmark_results.jsonl', verbose:bool=False, measureMemory:bool=True):
+	#Runs each scenario with each engine in a working folder of synthetic data, appends one json line per run to outputFile and returns the results.
+	#measureMemory runs each scenario a second time under tracemalloc for peakMemoryMB.  engines defaults to loop and vectorized
+	if engines is None: engines = ['loop','vectorized']
+	outputFile = os.path.abspath(outputFile)
+	workFolder = os.path.abspath(benchmarkFolder + 'v' + str(syntheticVersion) + '_seed' + str(seed)) + '/'
+	commit = _Commit()
+	results = []
+	startingFolder = os.getcwd()
+	os.makedirs(workFolder + 'data/trademodel', exist_ok=True)
+	os.chdir(workFolder)
+	try:
+		for name in (scenarioNames or list(scenarios.keys())):
+			tickerFunction, startDate, durationInYears, trials, run = scenarios[name]
+			tickers = tickerFunction()
+			GenerateSyntheticHistory(tickers + ['.INX'], 'data/historical/', seed=seed, listingSpread=name.startswith('Universe'))
+			panel = GetPricePanel(tickers + ['.INX'], dtype='float32' if len(tickers) >= largeUniverseSize else 'float64') #Built before timing starts, the same panel the signal picker uses
+			AttachPricePanel(panel) #Every PricingData reads the synthetic panel, nothing is downloaded
+			i0, i1 = panel.DateRange(startDate, pd.Timestamp(startDate) + pd.DateOffset(years=durationInYears * trials))
+			tradingDays = i1 - i0
+			for engine in engines:
+				_ClearMemos()
+				EnableProfiling(saveBreakdown=False)
+				start = time.perf_counter()
+				with contextlib.redirect_stdout(sys.stdout if verbose else io.StringIO()):
+					run(tickers, engine)
+				wallSeconds = time.perf_counter() - start
+				phases = ProfileSummary()
+				DisableProfiling()
+				peakMemoryMB = None
+				if measureMemory:
+					_ClearMemos()
+					tracemalloc.start()
+					with contextlib.redirect_stdout(io.StringIO()):
+						run(tickers, engine)
+					peakMemoryMB = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+					tracemalloc.stop()
+				result = {'commit':commit, 'timestamp':pd.Timestamp.now().isoformat(timespec='seconds'), 'scenario':name, 'engine':engine, 'tickers':len(tickers), 'tradingDays':tradingDays, 'wallSeconds':round(wallSeconds, 4), 'peakMemoryMB':peakMemoryMB, 'peakResidentMB':_PeakResidentMB(), 'daysPerSecond':round(tradingDays / wallSeconds, 2), 'python':platform.python_version(), 'numpy':np.__version__, 'pandas':pd.__version__, 'machine':platform.node(), 'phases':{k:round(v, 4) for k, v in phases['Total'].dropna().items()}}
+				print(name, engine, str(result['wallSeconds']) + 's', str(result['peakMemoryMB']) + 'MB traced', str(result['peakResidentMB']) + 'MB resident', str(result['daysPerSecond']) + ' days/s')
+				with open(outputFile, 'a') as f: f.write(json.dumps(result) + '\n')
+				results.append(result)
+	finally:
+		DetachPricePanel() #The synthetic panel is only attached while benchmarking
+		os.chdir(startingFolder)
+	return pd.DataFrame(results)
+
+def CompareBenchmarks(outputFile:str='benchmark_results.jsonl', baseCommit:str=None, commit:str=None):
+	#Wall time and memory of one commit relative to another for each scenario and engine, ratios above 1 are slower or bigger.  Defaults to the last two commits in the file
+	results = pd.read_json(outputFile, lines=True, dtype={'commit':str})
+	commits = list(dict.fromkeys(results['commit']))
+	if commit is None: commit = commits[-1]
+	if baseCommit is None: baseCommit = commits[-2] if len(commits) > 1 else commits[-1]
+	latest = results.groupby(['commit','scenario','engine'])[['wallSeconds','peakMemoryMB']].last()
+	comparison = latest.loc[commit].join(latest.loc[baseCommit], rsuffix='Base', how='inner')
+	comparison['wallRatio'] = comparison['wallSeconds'] / comparison['wallSecondsBase']
+	comparison['memoryRatio'] = comparison['peakMemoryMB'] / comparison['peakMemoryMBBase']
+	return comparison
+
+if __name__ == '__main__':
+	#python Benchmark.py [scenario,scenario] [engine,engine]
+	scenarioNames = sys.argv[1].split(',') if len(sys.argv) > 1 else None
+	engines = sys.argv[2].split(',') if len(sys.argv) > 2 else ['loop','vectorized']
+	RunBenchmarks(scenarioNames, engines)
+	print(CompareBenchmarks())
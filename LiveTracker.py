@@ -0,0 +1,140 @@
+import os, json
+import numpy as np
+import pandas as pd
+from PricePanel import GetPricePanel, RefreshHistory, ToDay
+from PriceSignals import SelectOnDay, SignalsOnDay
+from VectorBacktest import TranchCounts
+
+#Incremental price momentum model for tracking today's picks.  The model state (cash, positions, pending orders, where the day counter is relative
+#to ReEvaluationInterval and the latest picks) is saved after every update, so the next update only processes the trading days added since then.
+#Fills are the same as VectorBacktest: positions are sold at the rebalance day open and the new picks ordered at its close in tranches, then bought at the next open.
+#Like RunPriceMomentum in PriceMomentumTrader the tranches are split by each pick's point value (allocateByPointValue), picks without a positive point value get none.
+#Each update first fetches newer prices for the tickers whose histories have fallen behind, so the days since the last update get processed.
+#Reloading the panel then reads only the refreshed csv files and appends their new days to the cached arrays, see PricePanel._UpdateCache.
+liveFolder = 'data/live/'
+
+class LiveTracker():
+	def __init__(self, tickerList:list, stockCount:int=5, ReEvaluationInterval:int=20, filterOption:int=3, longHistory:int=365, shortHistory:int=90, minPercentGain=0.05, portfolioSize:int=30000, allocateByPointValue:bool=True, stateFolder:str=liveFolder):
+		self.tickerList = list(tickerList)
+		self.allocateByPointValue = allocateByPointValue
+		self.stockCount = stockCount
+		self.ReEvaluationInterval = ReEvaluationInterval
+		self.filterOption = filterOption
+		self.longHistory = longHistory
+		self.shortHistory = shortHistory
+		self.minPercentGain = minPercentGain
+		self.portfolioSize = portfolioSize
+		self.modelName = 'PriceMomentumLive_longHistory_' + str(longHistory) +'_shortHistory_' + str(shortHistory) + '_reeval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount) + '_filter' + str(filterOption) + '_' + str(minPercentGain)
+		self._stateFile = stateFolder + self.modelName + '.json'
+		self._dailyValueFile = stateFolder + self.modelName + '_dailyvalue.csv'
+		self.panel = None
+		self.state = None
+		if os.path.isfile(self._stateFile):
+			with open(self._stateFile) as f: self.state = json.load(f)
+
+	def _SaveState(self):
+		os.makedirs(os.path.dirname(self._stateFile), exist_ok=True)
+		with open(self._stateFile + '.tmp', 'w') as f: json.dump(self.state, f, indent=1)
+		os.replace(self._stateFile + '.tmp', self._stateFile)
+
+	def _LastPrice(self, i:int, day:int):
+		#Close on day, or the last close before it when the ticker didn't trade
+		close = self.panel.fields['Close'][i, max(0, day - 10):day + 1]
+		valid = close[~np.isnan(close)]
+		return float(valid[-1]) if len(valid) > 0 else 0.0
+
+	def _Weights(self, picks:list, day:int):
+		#TargetHoldings of the picks, their point value on day or 1 each when allocating evenly
+		if not self.allocateByPointValue: return np.ones(len(picks))
+		longHistoryPC, shortHistoryPC, pointValue = SignalsOnDay(self.panel, day, self.longHistory, self.shortHistory, np.asarray(picks, dtype=int))
+		return np.nan_to_num(pointValue, nan=0.0)
+
+	def RefreshPrices(self, verbose:bool=False):
+		#Fetches the histories of the tickers that traded on the panel's last day when that day is before the last weekday, returns the tickers refreshed.
+		#Tickers whose prices stopped earlier have delisted and are left alone
+		panel = GetPricePanel(self.tickerList + ['.INX'])
+		lastWeekday = np.busday_offset(ToDay(pd.Timestamp.today()), -1, roll='forward')
+		if len(panel.dates) > 0 and panel.dates[-1] >= lastWeekday: return []
+		current = ~np.isnan(panel.fields['Close'][:, -1]) if len(panel.dates) > 0 else np.ones(len(panel.tickers), dtype=bool)
+		refreshed = [t for t, c in zip(panel.tickers, current) if c and RefreshHistory(t, verbose)]
+		if len(refreshed) > 0: self.panel = GetPricePanel(self.tickerList + ['.INX'], reload=True)
+		return refreshed
+
+	def _Panel(self):
+		if self.panel is None: self.panel = GetPricePanel(self.tickerList + ['.INX'])
+		return self.panel
+
+	def Update(self, startDate=None, endDate=None, refreshPrices:bool=True):
+		#Processes the trading days after the last checkpoint through endDate (default the latest day with prices), startDate is only used by the first update.
+		#refreshPrices fetches newer prices first
+		if refreshPrices: self.RefreshPrices()
+		self.panel = panel = GetPricePanel(self.tickerList + ['.INX'])
+		dates = panel.dates
+		if self.state is None:
+			if startDate is None: raise ValueError('startDate is required for the first update of ' + self.modelName)
+			self.state = {'startDate':str(ToDay(startDate)), 'lastDate':None, 'cash':float(self.portfolioSize), 'positions':{}, 'pendingBuys':[], 'dayCounter':0, 'picks':[]}
+			firstDay = int(np.searchsorted(dates, ToDay(startDate), side='left'))
+		else:
+			firstDay = int(np.searchsorted(dates, np.datetime64(self.state['lastDate']), side='right'))
+		lastDay = len(dates) - 1 if endDate is None else panel.DateIndex(endDate)
+		universe = np.zeros(len(panel.tickers), dtype=bool)
+		for t in self.tickerList:
+			if panel.TickerIndex(t) >= 0: universe[panel.TickerIndex(t)] = True
+		tranchSize = self.portfolioSize/self.stockCount
+		state = self.state
+		rows = []
+		for day in range(firstDay, lastDay + 1):
+			for order in state['pendingBuys']:
+				i = panel.TickerIndex(order['ticker'])
+				price = float(panel.fields['Open'][i, day])
+				if not price > 0: price = self._LastPrice(i, day)
+				units = min(order['units'], np.floor(state['cash'] / price)) if price > 0 else 0
+				if units <= 0: continue
+				state['cash'] -= units * price
+				state['positions'][order['ticker']] = {'units':float(units), 'purchasePrice':price, 'dateBuyOrderFilled':str(dates[day])}
+			state['pendingBuys'] = []
+			if state['dayCounter'] == 0:
+				for ticker, position in state['positions'].items():
+					i = panel.TickerIndex(ticker)
+					price = float(panel.fields['Open'][i, day])
+					if not price > 0: price = self._LastPrice(i, day)
+					state['cash'] += position['units'] * price
+				state['positions'] = {}
+				picks = SelectOnDay(panel, day, self.longHistory, self.shortHistory, self.stockCount, self.filterOption, self.minPercentGain, universe)
+				state['picks'] = [panel.tickers[i] for i in picks]
+				orders = sorted(zip(picks, self._Weights(picks, day)), key=lambda order: panel.tickers[order[0]]) #Same order as the TargetHoldings groupby, which decides who is short of cash
+				orders = [(i, self._LastPrice(i, day), weight) for i, weight in orders if weight > 0]
+				orders = [(i, orderPrice, weight) for i, orderPrice, weight in orders if orderPrice > 0]
+				if len(orders) > 0:
+					for (i, orderPrice, weight), tranchCount in zip(orders, TranchCounts(state['cash'], tranchSize, [weight for i, orderPrice, weight in orders])):
+						if tranchCount > 0: state['pendingBuys'].append({'ticker':panel.tickers[i], 'units':float(tranchCount * np.round(tranchSize / orderPrice)), 'buyOrderPrice':orderPrice, 'dateBuyOrderPlaced':str(dates[day])})
+			state['dayCounter'] += 1
+			if state['dayCounter'] >= self.ReEvaluationInterval: state['dayCounter'] = 0
+			asset = sum(p['units'] * self._LastPrice(panel.TickerIndex(t), day) for t, p in state['positions'].items())
+			rows.append((pd.Timestamp(dates[day]), state['cash'], asset, state['cash'] + asset))
+			state['lastDate'] = str(dates[day])
+		self._SaveState()
+		dailyValue = pd.DataFrame(rows, columns=['Date','CashValue','AssetValue','TotalValue']).set_index('Date')
+		if len(dailyValue) > 0: dailyValue.to_csv(self._dailyValueFile, mode='a', header=not os.path.isfile(self._dailyValueFile))
+		return dailyValue
+
+	def PositionSummary(self):
+		#Current holdings valued at the last processed close, plus the orders waiting to fill on the next trading day
+		result = pd.DataFrame(columns=['ticker','units','purchasePrice','lastPrice','status','value'])
+		if self.state is None: return result
+		self._Panel()
+		day = self.panel.DateIndex(self.state['lastDate']) if self.state['lastDate'] is not None else -1
+		result = pd.DataFrame([{'ticker':t, 'units':p['units'], 'purchasePrice':p['purchasePrice'], 'lastPrice':self._LastPrice(self.panel.TickerIndex(t), day) if day >= 0 else np.nan, 'status':'long'} for t, p in self.state['positions'].items()] + [{'ticker':o['ticker'], 'units':o['units'], 'purchasePrice':np.nan, 'lastPrice':o['buyOrderPrice'], 'status':'buy'} for o in self.state['pendingBuys']], columns=['ticker','units','purchasePrice','lastPrice','status'])
+		result['value'] = result['units'] * result['lastPrice']
+		return result
+
+	def NextRebalance(self):
+		#Trading days until the next rebalance and the stocks that would be picked on the last processed day.  Before the first update that is
+		#the panel's last day, and the first update rebalances on the first day it processes
+		self._Panel()
+		daysUntil = 0 if self.state is None else (self.ReEvaluationInterval - self.state['dayCounter']) % self.ReEvaluationInterval
+		day = len(self.panel.dates) - 1 if self.state is None or self.state['lastDate'] is None else self.panel.DateIndex(self.state['lastDate'])
+		universe = np.array([t in self.tickerList for t in self.panel.tickers])
+		picks = SelectOnDay(self.panel, day, self.longHistory, self.shortHistory, self.stockCount, self.filterOption, self.minPercentGain, universe)
+		targets = pd.DataFrame({'TargetHoldings':self._Weights(picks, day)}, index=pd.Index([self.panel.tickers[i] for i in picks], name='Ticker'))
+		return daysUntil, targets
@@ -0,0 +1,215 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from PricePanel import GetPricePanel
+from PriceSignals import FilterMask, RankScore, PointValue, WarnUnchecked, largeUniverseSize
+from VectorBacktest import ForwardFill, maxTranches
+
+#Batched Monte Carlo of the price momentum strategy against BuyHold.  Each scenario is a price path built from blocks of historical days
+#(blockSize=None uses one contiguous historical window), a random rebalance offset and a random subset of the universe.  A block keeps the closes,
+#opens and calendar gaps of its days, scaled so the first day's return from the last day of the block before it is the historical one.
+#A chunk of scenarios is one scenario x day x ticker array and is simulated together: on each rebalance step every scenario's signals are a
+#gather from its path, filtered with FilterMask/RankScore like MomentumSignals.Select, ties going to the earlier ticker like TopK.
+#Windows and lags are in calendar days like WalkForward: the window is the path days within 365 * durationInYears days of its first day and the lags
+#look back to the last day on or before longHistory/shortHistory days earlier.  Fills are VectorPortfolio's: everything held is sold at the rebalance day
+#open, TranchCounts tranches of round(tranchSize / close) units are ordered at its close for the picks in ticker order and filled at the next open,
+#and the last day sells at its open.  In historical mode with offset 0 and the whole universe a scenario is WalkForward.RunWindow, see VerifyMonteCarlo.
+#Chunks are sized to memoryMB and run in parallel with workers > 1, each chunk has its own seed so results don't depend on the worker count.
+_history = None
+
+def _RowSpan(dates, days:int):
+	#Most rows any days long stretch of the history covers, counting both ends
+	return int((np.searchsorted(dates, dates + np.timedelta64(days, 'D'), side='right') - np.arange(len(dates))).max())
+
+def _LoadHistory(tickerList:list, baselineTicker:str):
+	#Day x ticker forward filled closes and opens of the universe with the baseline as the last column, shared by every chunk the process runs
+	global _history
+	if _history is not None and _history['tickers'] == list(tickerList) and _history['baselineTicker'] == baselineTicker: return _history
+	panel = GetPricePanel(list(tickerList) + [baselineTicker], dtype='float32' if len(tickerList) >= largeUniverseSize else 'float64')
+	if panel.TickerIndex(baselineTicker) < 0 or np.isnan(panel.fields['Close'][panel.TickerIndex(baselineTicker)]).all(): raise ValueError('No prices for ' + baselineTicker)
+	universe = [panel.TickerIndex(t) for t in dict.fromkeys(tickerList) if panel.TickerIndex(t) >= 0 and t != baselineTicker]
+	columns = np.array(universe + [panel.TickerIndex(baselineTicker)])
+	close = ForwardFill(panel.fields['Close'][columns]) #Same prices as WalkForward, carried forward after a ticker's last day
+	openPrices = np.nan_to_num(panel.fields['Open'][columns], nan=0.0)
+	openPrices = np.where(openPrices > 0, openPrices, close)
+	close[close <= 0] = np.nan #Before a ticker's first price
+	openPrices[np.isnan(close)] = np.nan
+	traded = ~np.isnan(panel.fields['Close'][columns])
+	names = [panel.tickers[i] for i in universe]
+	valid = np.flatnonzero(traded[-1])
+	_history = {'tickers':list(tickerList), 'baselineTicker':baselineTicker, 'dates':panel.dates, 'close':np.ascontiguousarray(close.T), 'open':np.ascontiguousarray(openPrices.T), 'traded':np.ascontiguousarray(traded.T), 'nameRank':np.argsort(np.argsort(names)), 'first':valid[0], 'last':valid[-1] + 1}
+	return _history
+
+def _PathRows(h, durationInYears:int, longHistory:int, shortHistory:int):
+	#Rows before the window that reach back to the longest lag, and rows the window can cover
+	dates = h['dates']
+	return _RowSpan(dates, max(longHistory, shortHistory)), _RowSpan(dates, 365 * durationInYears)
+
+def ScenarioBytes(pathRows:int, tickerCount:int, itemSize:int=8):
+	#Working memory of one scenario, its closes, opens and traded days
+	return pathRows * tickerCount * (2 * itemSize + 1)
+
+def _LagRows(pathDays, day, days:int):
+	#For each scenario the last path row on or before days before row day, -1 if the path starts after that
+	s = np.arange(len(day))
+	return (pathDays <= (pathDays[s, day] - days)[:, None]).sum(axis=1) - 1
+
+def _RunChunk(chunk:int, scenarioCount:int, settings:dict):
+	h = _LoadHistory(settings['tickerList'], settings['baselineTicker'])
+	rng = np.random.default_rng([settings['seed'], chunk])
+	S = scenarioCount
+	s = np.arange(S)
+	dates = h['dates'].astype('datetime64[D]').astype(np.int64)
+	n = len(dates)
+	windowDays = 365 * settings['durationInYears']
+	warmupRows, horizonRows = _PathRows(h, settings['durationInYears'], settings['longHistory'], settings['shortHistory'])
+	pathRows = warmupRows + horizonRows
+	first, last = max(h['first'], 1), h['last']
+	blockSize = settings['blockSize']
+	if blockSize is None:
+		#One historical window per scenario, starting on a day with the warmup before it and a whole window after it
+		latest = int(np.searchsorted(dates, dates[last - 1] - windowDays, side='right'))
+		if latest <= first + warmupRows: raise ValueError('Not enough price history for a ' + str(settings['durationInYears']) + ' year window')
+		rows = rng.integers(first + warmupRows, latest, S)[:, None] - warmupRows + np.arange(pathRows)
+	else:
+		if last - first < blockSize: raise ValueError('Not enough price history for blocks of ' + str(blockSize) + ' days')
+		blockCount = -(-pathRows // blockSize)
+		starts = rng.integers(first, last - blockSize + 1, (S, blockCount))
+		rows = (starts[:, :, None] + np.arange(blockSize)).reshape(S, -1)[:, :pathRows]
+	beyond = rows >= n #Only past the end of a historical window
+	rows = np.minimum(rows, n - 1)
+	gaps = np.where(beyond, windowDays + 1, dates[rows] - dates[rows - 1])
+	gaps[:, 0] = 0
+	pathDays = np.cumsum(gaps, axis=1)
+	close = h['close'][rows]
+	openPrices = h['open'][rows]
+	traded = h['traded'][rows] & ~beyond[:, :, None]
+	if blockSize is not None:
+		for k in range(blockSize, pathRows, blockSize): #Each block continues from the last close of the one before it
+			scale = close[:, k - 1] / h['close'][rows[:, k] - 1]
+			close[:, k:k + blockSize] *= scale[:, None, :]
+			openPrices[:, k:k + blockSize] *= scale[:, None, :]
+	tickerCount = close.shape[2] - 1
+	universe = np.ones((S, tickerCount), dtype=bool)
+	if blockSize is not None: universe &= ~np.isnan(close[:, :, :tickerCount]).any(axis=1) #Tickers unlisted anywhere on a resampled path are left out of that scenario
+	if settings['universeSize'] and settings['universeSize'] < tickerCount:
+		subset = np.zeros((S, tickerCount), dtype=bool)
+		np.put_along_axis(subset, np.argsort(rng.random((S, tickerCount)), axis=1)[:, :settings['universeSize']], True, axis=1)
+		universe &= subset
+	windowStart = warmupRows
+	windowEnd = (pathDays <= (pathDays[:, windowStart] + windowDays)[:, None]).sum(axis=1)
+	dayCount = windowEnd - windowStart
+	ReEvaluationInterval = settings['ReEvaluationInterval']
+	offsets = rng.integers(0, ReEvaluationInterval, S) if settings['randomOffsets'] else np.zeros(S, dtype=int)
+	portfolioSize = settings['portfolioSize']
+	stockCount = min(settings['stockCount'], tickerCount)
+	tranchSize = portfolioSize / settings['stockCount']
+	cash = np.full(S, float(portfolioSize))
+	held = np.zeros((S, stockCount), dtype=int)
+	units = np.zeros((S, stockCount))
+	def Price(prices, day, tickers): return prices[s[:, None], day[:, None], tickers]
+	def Sell(active, day):
+		#Everything held at day's open
+		value = np.where(units > 0, units * Price(openPrices, day, held), 0).sum(axis=1)
+		return np.where(active, cash + value, cash), np.where(active[:, None], 0, units)
+	for step in range(-(-int(dayCount.max()) // ReEvaluationInterval)):
+		day = windowStart + offsets + step * ReEvaluationInterval
+		active = day < windowEnd
+		if not active.any(): break
+		day = np.minimum(day, windowEnd - 1)
+		cash, units = Sell(active, day)
+		signals = []
+		for days in (settings['longHistory'], settings['shortHistory']):
+			lag = _LagRows(pathDays, day, days)
+			current = np.where(traded[s, day, :tickerCount], close[s, day, :tickerCount], np.nan)
+			previous = np.where(traded[s, np.maximum(lag, 0), :tickerCount] & (lag >= 0)[:, None], close[s, np.maximum(lag, 0), :tickerCount], np.nan)
+			with np.errstate(divide='ignore', invalid='ignore'):
+				signals.append(current / previous - 1)
+		longHistoryPC, shortHistoryPC = signals
+		pointValue = PointValue(longHistoryPC, shortHistoryPC)
+		mask = FilterMask(settings['filterOption'], longHistoryPC, shortHistoryPC, pointValue, settings['minPercentGain']) & universe
+		score = np.where(mask, RankScore(settings['filterOption'], longHistoryPC, shortHistoryPC, pointValue), -np.inf)
+		picks = np.argsort(-score, axis=1, kind='stable')[:, :stockCount] #Highest first, equal scores in ticker order
+		valid = np.take_along_axis(mask, picks, axis=1)
+		byName = np.argsort(np.where(valid, h['nameRank'][picks], tickerCount), axis=1, kind='stable') #Picks ordered by ticker like WalkForward.Picks, the invalid ones last
+		picks = np.take_along_axis(picks, byName, axis=1)
+		valid = np.take_along_axis(valid, byName, axis=1)
+		fillDay = np.minimum(day + 1, windowEnd - 1)
+		orderPrices = Price(close, day, picks)
+		fillPrices = Price(openPrices, fillDay, picks)
+		with np.errstate(invalid='ignore'):
+			valid &= (active & (day + 1 < windowEnd))[:, None] & (orderPrices > 0) & (fillPrices > 0)
+		#TranchCounts with equal weights: the tranches the cash buys split evenly, the remainder one each to the first targets
+		targetCount = valid.sum(axis=1)
+		tranchCount = np.minimum((cash / tranchSize + 1e-9).astype(int), maxTranches)
+		base = tranchCount // np.maximum(targetCount, 1)
+		rank = np.cumsum(valid, axis=1) - 1
+		counts = np.where(valid, base[:, None] + (rank < (tranchCount - base * targetCount)[:, None]), 0)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			tranchUnits = np.where(valid, np.round(tranchSize / orderPrices), 0)
+		newUnits = np.zeros((S, stockCount))
+		for j in range(stockCount): #One tranche at a time like VectorPortfolio.BuyIndexes, each limited to the cash left
+			buying = counts[:, j] > 0
+			for t in range(int(counts[:, j].max())):
+				fillPrice = np.where(buying, fillPrices[:, j], 1)
+				bought = np.where(buying & (t < counts[:, j]), np.minimum(tranchUnits[:, j], np.floor(cash / fillPrice)), 0)
+				buying &= bought > 0
+				bought = np.where(buying, bought, 0)
+				cash = cash - bought * fillPrice
+				newUnits[:, j] += bought
+		held = np.where(active[:, None], picks, held)
+		units = np.where(active[:, None], newUnits, units)
+	modelEndingValue, units = Sell(np.ones(S, dtype=bool), windowEnd - 1)
+	#BuyHold like BuyHoldFromPrices: ten tranches ordered at the first close of the window, filled at the next open and sold at the last open
+	inWindow = traded[:, :, tickerCount] & (np.arange(pathRows) >= windowStart) & (np.arange(pathRows) < windowEnd[:, None])
+	tradedCount = inWindow.sum(axis=1)
+	firstRow = np.argmax(inWindow, axis=1)
+	secondRow = np.argmax(inWindow & (np.arange(pathRows) > firstRow[:, None]), axis=1)
+	lastRow = pathRows - 1 - np.argmax(inWindow[:, ::-1], axis=1)
+	index = close[:, :, tickerCount]
+	indexOpen = openPrices[:, :, tickerCount]
+	orderPrice = index[s, firstRow]
+	fillPrice = indexOpen[s, secondRow]
+	with np.errstate(divide='ignore', invalid='ignore'):
+		indexUnits = np.minimum(10 * np.round(portfolioSize / 10 / orderPrice), np.floor(portfolioSize / fillPrice))
+	buyHoldEndingValue = np.where(tradedCount >= 2, portfolioSize - indexUnits * fillPrice + indexUnits * indexOpen[s, lastRow], 0)
+	return pd.DataFrame({'PathStart':pd.DatetimeIndex(h['dates'][rows[:, windowStart]]), 'Offset':offsets, 'Tickers':universe.sum(axis=1), 'BuyHoldEndingValue':buyHoldEndingValue, 'ModelEndingValue':modelEndingValue, 'BuyHoldGain':buyHoldEndingValue / portfolioSize - 1, 'ModelGain':modelEndingValue / portfolioSize - 1, 'Difference':(modelEndingValue - buyHoldEndingValue) / portfolioSize})
+
+def RunMonteCarlo(tickerList:list, scenarios:int=1000, durationInYears:int=1, blockSize:int=20, universeSize:int=None, randomOffsets:bool=True, stockCount:int=9, ReEvaluationInterval:int=20, filterOption:int=3, longHistory:int=365, shortHistory:int=90, minPercentGain=0.05, portfolioSize:int=30000, seed:int=0, workers:int=1, memoryMB:int=256, baselineTicker:str='.INX'):
+	#One row per scenario with the BuyHold and model ending values and gains, Difference is the excess return over BuyHold.  Picks use the unchecked PriceSignals filters
+	WarnUnchecked('RunMonteCarlo')
+	settings = {'tickerList':list(tickerList), 'baselineTicker':baselineTicker, 'durationInYears':durationInYears, 'blockSize':blockSize, 'universeSize':universeSize, 'randomOffsets':randomOffsets, 'stockCount':stockCount, 'ReEvaluationInterval':ReEvaluationInterval, 'filterOption':filterOption, 'longHistory':longHistory, 'shortHistory':shortHistory, 'minPercentGain':minPercentGain, 'portfolioSize':portfolioSize, 'seed':seed}
+	h = _LoadHistory(tickerList, baselineTicker) #Builds the panel cache before any worker maps it
+	chunkSize = max(1, min(scenarios, int(memoryMB * 2**20 // ScenarioBytes(sum(_PathRows(h, durationInYears, longHistory, shortHistory)), h['close'].shape[1], h['close'].itemsize))))
+	chunks = [(chunk, min(chunkSize, scenarios - chunk * chunkSize)) for chunk in range(-(-scenarios // chunkSize))]
+	if workers > 1 and len(chunks) > 1:
+		with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_LoadHistory, initargs=(list(tickerList), baselineTicker)) as pool:
+			results = list(pool.map(_RunChunk, [c for c, n in chunks], [n for c, n in chunks], [settings] * len(chunks)))
+	else:
+		results = [_RunChunk(chunk, n, settings) for chunk, n in chunks]
+	return pd.concat(results, ignore_index=True)
+
+def VerifyMonteCarlo(tickerList:list, scenarios:int=20, durationInYears:int=1, stockCount:int=9, ReEvaluationInterval:int=20, filterOption:int=3, longHistory:int=365, shortHistory:int=90, minPercentGain=0.05, portfolioSize:int=30000, seed:int=0, baselineTicker:str='.INX'):
+	#Checks historical scenarios with offset 0 and the whole universe against WalkForward.RunWindow and BuyHoldFromPrices from the same start date,
+	#returns the scenarios where either ending value differs.  An empty result means the two agree, tests/test_monte_carlo.py runs this on synthetic price histories
+	from WalkForward import WalkForward
+	from BaselineCache import BuyHoldFromPrices
+	results = RunMonteCarlo(tickerList, scenarios, durationInYears, None, None, False, stockCount, ReEvaluationInterval, filterOption, longHistory, shortHistory, minPercentGain, portfolioSize, seed, baselineTicker=baselineTicker)
+	walkForward = WalkForward(tickerList, longHistory, shortHistory, baselineTicker)
+	mismatches = []
+	for row in results.itertuples():
+		expectedModel = walkForward.RunWindow(row.PathStart, durationInYears, 0, stockCount, ReEvaluationInterval, filterOption, minPercentGain, portfolioSize)
+		expectedBuyHold = BuyHoldFromPrices(walkForward.panel, baselineTicker, row.PathStart, durationInYears, portfolioSize)
+		if not np.allclose([row.ModelEndingValue, row.BuyHoldEndingValue], [expectedModel, expectedBuyHold], rtol=1e-9, atol=1e-6): mismatches.append((row.PathStart, expectedModel, row.ModelEndingValue, expectedBuyHold, row.BuyHoldEndingValue))
+	print(str(len(mismatches)) + ' mismatches')
+	for m in mismatches: print(m)
+	return mismatches
+
+def SummarizeMonteCarlo(results:pd.DataFrame):
+	#Distribution of the ending values and of the excess return over BuyHold, Beat is the share of scenarios where the model did better
+	summary = {}
+	for column in ['BuyHoldEndingValue', 'ModelEndingValue', 'Difference']:
+		values = results[column]
+		summary[column] = {'Scenarios':len(values), 'Mean':values.mean(), 'Std':values.std(), 'P5':values.quantile(.05), 'P25':values.quantile(.25), 'Median':values.median(), 'P75':values.quantile(.75), 'P95':values.quantile(.95)}
+	summary['Difference']['Beat'] = (results['Difference'] > 0).mean()
+	return pd.DataFrame(summary).T
@@ -0,0 +1,131 @@
+import os, itertools, json, hashlib
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from _classes.PriceTradeAnalyzer import StockPicker
+from _classes.Utility import *
+from PricePanel import GetPricePanel
+from PriceSignals import CreateSignalPicker
+from BaselineCache import RunBuyHoldCached
+from Profiling import logger
+
+#Runs a strategy over a grid of parameters in one year trials against BuyHold, replacing hand written lists of Compare calls.
+#BuyHold is run once per start date and ReEvaluationInterval, and grid points with the same longHistory/shortHistory windows are run by one task
+#on one picker.  With the default StockPicker that only shares the loaded price histories, StockPicker still recomputes every ticker on every rebalance.
+#With useSignals the picker reads the shared price panel and the momentum signals of a window are computed once per worker.
+#Every finished task is appended to resultsFile with the sweep's key, rerunning the same sweep skips the rows already there.  The key covers
+#everything besides the grid that changes a result, so sweeps sharing a file never resume or return each other's rows.
+def ParameterGrid(grid:dict):
+	#{'longHistory':[120,180], 'stockCount':[5,9]} -> [{'longHistory':120, 'stockCount':5}, ...]
+	names = list(grid.keys())
+	return [dict(zip(names, values)) for values in itertools.product(*[grid[n] for n in names])]
+
+def _ResultKey(params:dict, startDate:str):
+	#Numbers are compared as floats so values read back from the csv match the grid
+	return tuple(str(float(params[n])) if isinstance(params[n], (int, float, np.number)) else str(params[n]) for n in sorted(params)) + (startDate,)
+
+def _SweepKey(strategy, baseline, tickerList:list, useSignals:bool, strategyArgs:dict):
+	description = json.dumps([strategy.__name__, baseline.__name__, list(tickerList), bool(useSignals), sorted((n, str(v)) for n, v in strategyArgs.items())])
+	return hashlib.md5(description.encode()).hexdigest()[:12]
+
+def _MapPanel(tickerList:list):
+	#Maps the panel the signal picker and the vectorized engine read, TradingModel keeps loading through the library
+	GetPricePanel(list(tickerList) + ['.INX'])
+
+def _CreatePicker(tickerList:list, startDates:list, durationInYears:int, useSignals:bool):
+	#One picker covering every trial of a task
+	startDate = AddDays(ToDate(min(startDates, key=ToDate)), -730)
+	endDate = AddDays(ToDate(max(startDates, key=ToDate)), 365 * durationInYears)
+	if useSignals:
+		picker = CreateSignalPicker(tickerList, startDate, endDate)
+	else:
+		picker = StockPicker(startDate, endDate)
+	for t in tickerList:
+		picker.AddTicker(t)
+	return picker
+
+def _RunBaselineTask(baseline, startDate:str, durationInYears:int, ReEvaluationInterval:int, portfolioSize:int):
+	try:
+		return startDate, ReEvaluationInterval, baseline('.INX', startDate=startDate, durationInYears=durationInYears, ReEvaluationInterval=ReEvaluationInterval, portfolioSize=portfolioSize), ''
+	except Exception as e:
+		return startDate, ReEvaluationInterval, None, repr(e)
+
+def _RunStrategyTask(strategy, tickerList:list, trials:list, durationInYears:int, portfolioSize:int, useSignals:bool, strategyArgs:dict):
+	#trials is a list of (params, startDate) sharing the same momentum windows, returns (params, startDate, endingValue, error) for each
+	picker = None
+	results = []
+	for params, startDate in trials:
+		try:
+			if picker is None: picker = _CreatePicker(tickerList, [startDate for params, startDate in trials], durationInYears, useSignals)
+			endingValue = strategy(tickerList=tickerList, startDate=startDate, durationInYears=durationInYears, portfolioSize=portfolioSize, returndailyValues=False, verbose=False, picker=picker, **params, **strategyArgs)
+			results.append((params, startDate, endingValue, ''))
+		except Exception as e:
+			results.append((params, startDate, None, repr(e)))
+	return results
+
+def RunSweep(strategy, baseline, tickerList:list, grid:dict, startYear:int=1982, endYear:int=2018, durationInYears:int=1, workers:int=1, useSignals:bool=False, strategyArgs:dict=None, resultsFile:str=None):
+	#strategy is RunPriceMomentum or a function with the same keywords, baseline is RunBuyHoldMemo or RunBuyHold.  Returns the consolidated results, one row per grid point and start date
+	portfolioSize=30000
+	if strategyArgs is None: strategyArgs = {}
+	points = ParameterGrid(grid)
+	trials = int((endYear - startYear)/durationInYears)
+	startDates = ['1/2/' + str(startYear + i * durationInYears) for i in range(trials)]
+	sweepKey = _SweepKey(strategy, baseline, tickerList, useSignals, strategyArgs)
+	if resultsFile is None: resultsFile = 'data/trademodel/Sweep_' + strategy.__name__ + '_' + '_'.join(sorted(grid.keys())) + '_year ' + str(startYear) + '_duration' + str(durationInYears) + '_' + sweepKey + '.csv'
+	requested = {_ResultKey(params, startDate) for params in points for startDate in startDates}
+	previous = _LoadSweep(resultsFile, list(grid.keys()), sweepKey, requested)
+	completed = {_ResultKey(dict(zip(grid.keys(), index[:-1])), index[-1]) for index in previous.index}
+	if len(completed) > 0: logger.info('Resuming sweep, ' + str(len(completed)) + ' results already in ' + resultsFile)
+	pending = [(params, startDate) for params in points for startDate in startDates if not _ResultKey(params, startDate) in completed]
+	if len(pending) == 0: return _LoadSweep(resultsFile, list(grid.keys()), sweepKey, requested)
+	#Build the panel caches the workers read before starting them, so they only map them
+	usesPanel = useSignals or strategyArgs.get('vectorized', False)
+	if usesPanel: _MapPanel(tickerList)
+	elif baseline is RunBuyHoldCached: GetPricePanel(['.INX'])
+	initializer, initargs = (_MapPanel, (tickerList,)) if usesPanel else (None, ())
+	workers = max(1, workers)
+	with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+		#BuyHold only depends on the start date and ReEvaluationInterval, run each one once for the whole grid
+		baselineKeys = sorted({(startDate, params.get('ReEvaluationInterval', 20)) for params, startDate in pending})
+		baselines = {}
+		for f in as_completed([pool.submit(_RunBaselineTask, baseline, startDate, durationInYears, reeval, portfolioSize) for startDate, reeval in baselineKeys]):
+			startDate, reeval, value, error = f.result()
+			if error: logger.warning('BuyHold ' + startDate + ' failed: ' + error)
+			baselines[(startDate, reeval)] = value
+		#Group points by momentum windows and split the groups so there are enough tasks for the workers
+		groups = {}
+		for params, startDate in pending:
+			groups.setdefault((params.get('longHistory'), params.get('shortHistory')), []).append((params, startDate))
+		chunks = max(1, int(np.ceil(workers / len(groups))))
+		tasks = [trialList[i::chunks] for trialList in groups.values() for i in range(chunks) if len(trialList[i::chunks]) > 0]
+		futures = [pool.submit(_RunStrategyTask, strategy, tickerList, task, durationInYears, portfolioSize, useSignals, strategyArgs) for task in tasks]
+		for f in as_completed(futures):
+			rows = []
+			for params, startDate, m2ev, error in f.result():
+				m1ev = baselines.get((startDate, params.get('ReEvaluationInterval', 20)))
+				if error or m1ev is None:
+					logger.warning('Trial ' + str(params) + ' ' + startDate + ' failed: ' + (error or 'no BuyHold baseline'))
+					continue
+				m1pg = (m1ev/portfolioSize) - 1
+				m2pg = (m2ev/portfolioSize) - 1
+				rows.append(dict(params, Sweep=sweepKey, StartDate=startDate, Duration=durationInYears, BuyHoldEndingValue=m1ev, ModelEndingValue=m2ev, BuyHoldGain=m1pg, ModelGain=m2pg, Difference=m2pg-m1pg))
+			if len(rows) > 0:
+				os.makedirs(os.path.dirname(resultsFile) or '.', exist_ok=True)
+				pd.DataFrame(rows).to_csv(resultsFile, mode='a', header=not os.path.isfile(resultsFile), index=False)
+	return _LoadSweep(resultsFile, list(grid.keys()), sweepKey, requested)
+
+def _LoadSweep(resultsFile:str, keyColumns:list, sweepKey:str, requested:set):
+	#The rows of this sweep whose grid point and start date were requested
+	if not os.path.isfile(resultsFile): return pd.DataFrame()
+	results = pd.read_csv(resultsFile)
+	if not 'Sweep' in results.columns or not all(n in results.columns for n in keyColumns): return pd.DataFrame()
+	results = results[results['Sweep'] == sweepKey]
+	results = results[np.array([_ResultKey({n:row[n] for n in keyColumns}, row['StartDate']) in requested for row in results.to_dict('records')], dtype=bool)]
+	results = results.drop(columns='Sweep').sort_values(keyColumns + ['StartDate'])
+	results.set_index(keyColumns + ['StartDate'], inplace=True)
+	return results
+
+def SummarizeSweep(results:pd.DataFrame):
+	#Mean, worst and best difference from BuyHold for each grid point
+	keyColumns = [n for n in results.index.names if n != 'StartDate']
+	return results.groupby(level=keyColumns)['Difference'].agg(['mean','min','max','count']).sort_values('mean', ascending=False)
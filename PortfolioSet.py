@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+from _classes.Utility import *
+from PricePanel import GetPricePanel
+from PriceSignals import GetMomentumSignals, WarnUnchecked
+from VectorBacktest import ForwardFill, RebalanceDays, VectorPortfolio
+
+#Runs many strategy portfolios together over one timeline of the shared price panel.  Every strategy keeps its own cash, positions and rebalance
+#schedule, the set walks the union of their rebalance days once.  Signal matrices are computed once per (longHistory, shortHistory) and picks once
+#per (day, filter, stock count), so strategies rebalancing on the same day share one signal evaluation.  Fills are the same as VectorBacktest.
+#A strategy's targets(portfolioSet, day) returns the ticker indexes to buy and their TargetHoldings weights, a ticker may repeat.  With alignPositions
+#the weights of a ticker are summed and ordered by ticker like AlignPositions, otherwise each one is a separate order like PlaceBuy.
+#Picks always come from the PriceSignals filters, which are unchecked against StockPicker (see PriceSignals.PointValue), and every set warns so.
+
+class PortfolioStrategy():
+	#ReEvaluationInterval=None buys once on the first day and holds to the end
+	def __init__(self, modelName:str, targets, ReEvaluationInterval:int=20, tranchSize:float=3000, portfolioSize:float=30000, offset:int=0, alignPositions:bool=True):
+		self.modelName = modelName
+		self.alignPositions = alignPositions
+		self.targets = targets
+		self.ReEvaluationInterval = ReEvaluationInterval
+		self.tranchSize = tranchSize
+		self.portfolioSize = portfolioSize
+		self.offset = offset
+
+	def RebalanceDays(self, dayCount:int):
+		if self.ReEvaluationInterval is None: return [self.offset] if self.offset < dayCount else []
+		return RebalanceDays(dayCount, self.ReEvaluationInterval, self.offset)
+
+def BuyHoldStrategy(ticker:str='.INX', portfolioSize:float=30000):
+	#Same orders as RunBuyHold: ten tranches of the ticker on the first day
+	return PortfolioStrategy('BuyHold_' + ticker, lambda ps, day: ([ps.panel.TickerIndex(ticker)] * 10, [1] * 10), None, portfolioSize/10, portfolioSize, alignPositions=False)
+
+def BuyHoldListStrategy(tickerList:list, portfolioSize:float=30000):
+	#Same orders as RunBuyHoldList: one tranche of each ticker on the first day
+	return PortfolioStrategy('BuyHold_tickerList_count' + str(len(tickerList)), lambda ps, day: ([ps.panel.TickerIndex(t) for t in tickerList], [1] * len(tickerList)), None, portfolioSize/len(tickerList), portfolioSize, alignPositions=False)
+
+def PriceMomentumStrategy(stockCount:int=9, ReEvaluationInterval:int=20, filterOption:int=3, longHistory:int=365, shortHistory:int=90, minPercentGain=0.05, portfolioSize:float=30000):
+	#Same targets as PriceMomentumTargets
+	modelName = 'PriceMomentumShort_longHistory_' + str(longHistory) +'_shortHistory_' + str(shortHistory) + '_reeval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount) + '_filter' + str(filterOption) + '_' + str(minPercentGain)
+	def Targets(ps, day):
+		picks = ps.Picks(day, longHistory, shortHistory, stockCount, filterOption, minPercentGain)
+		return picks, [1] * len(picks)
+	return PortfolioStrategy(modelName, Targets, ReEvaluationInterval, portfolioSize/stockCount, portfolioSize)
+
+def BlendedStrategy(ReEvaluationInterval:int=20, longHistory:int=365, shortHistory:int=90, minPercentGain=0.05, portfolioSize:float=30000):
+	#Same targets as BlendedTargets, filter 3 is weighted twice
+	stockCount = 11
+	modelName = 'PriceMomentum_Blended3.3.44.PV_longHistory_' + str(longHistory) +'_shortHistory_' + str(shortHistory) + '_reeval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount)
+	def Targets(ps, day):
+		list1 = ps.Picks(day, longHistory, shortHistory, 2, 3, minPercentGain)
+		list3 = ps.Picks(day, longHistory, shortHistory, 2, 44, minPercentGain)
+		picks = list(list1) + list(list1) + list(list3)
+		return picks, [1] * len(picks)
+	return PortfolioStrategy(modelName, Targets, ReEvaluationInterval, portfolioSize/stockCount, portfolioSize)
+
+def PointValueStrategy(stockCount:int=9, ReEvaluationInterval:int=20, minPercentGain=0.05, portfolioSize:float=30000):
+	#Same targets as PointValueTargets, each pick is weighted by its Point_Value
+	modelName = 'PointValue_reeval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount) + '_' + str(minPercentGain)
+	def Targets(ps, day):
+		picks = ps.Picks(day, 365, 30, stockCount, 5, minPercentGain)
+		return picks, ps.Signals(365, 30).pointValue[day, picks]
+	return PortfolioStrategy(modelName, Targets, ReEvaluationInterval, 2500, portfolioSize)
+
+class PortfolioSet():
+	def __init__(self, tickerList:list, strategies:list=None, baselineTicker:str='.INX'):
+		self.panel = panel = GetPricePanel(list(tickerList) + [baselineTicker])
+		self.strategies = list(strategies or [])
+		WarnUnchecked('PortfolioSet')
+		self.universe = np.zeros(len(panel.tickers), dtype=bool)
+		for t in tickerList:
+			if panel.TickerIndex(t) >= 0: self.universe[panel.TickerIndex(t)] = True
+		self.close = ForwardFill(panel.fields['Close'])
+		openPrices = np.nan_to_num(panel.fields['Open'], nan=0.0)
+		self.openPrices = np.where(openPrices > 0, openPrices, self.close)
+		self._picks = {}
+
+	def Add(self, strategy:PortfolioStrategy): self.strategies.append(strategy)
+
+	def Signals(self, longHistory:int=365, shortHistory:int=30):
+		return GetMomentumSignals(self.panel, longHistory, shortHistory)
+
+	def Picks(self, day:int, longHistory:int, shortHistory:int, stockCount:int, filterOption:int, minPercentGain:float):
+		#Ticker indexes picked on a panel day, highest ranked first, shared by every strategy asking the same question that day
+		key = (day, longHistory, shortHistory, stockCount, filterOption, minPercentGain)
+		if not key in self._picks: self._picks[key] = self.Signals(longHistory, shortHistory).Select(day, stockCount, filterOption, minPercentGain, self.universe)
+		return self._picks[key]
+
+	def _Orders(self, indexes, weights):
+		#Sums the weights for each ticker and orders them by ticker like the TargetHoldings groupby, which decides who is short of cash
+		holdings = {}
+		for i, w in zip(indexes, weights):
+			if i >= 0: holdings[i] = holdings.get(i, 0) + w
+		tickers = sorted(holdings, key=lambda i: self.panel.tickers[i])
+		return tickers, [holdings[i] for i in tickers]
+
+	def Run(self, startDate, durationInYears:int):
+		#Returns {modelName: (dailyValue, trades)} for every strategy over the same dates
+		i0, i1 = self.panel.DateRange(startDate, AddDays(ToDate(startDate), 365 * durationInYears))
+		dayCount = i1 - i0
+		if dayCount < 1: return {s.modelName:(pd.DataFrame(columns=['CashValue','AssetValue','TotalValue']), pd.DataFrame()) for s in self.strategies}
+		dates = self.panel.dates[i0:i1]
+		close = self.close[:, i0:i1]
+		openPrices = self.openPrices[:, i0:i1]
+		portfolios = [VectorPortfolio(self.panel.tickers, dates, close, openPrices, s.portfolioSize, s.tranchSize) for s in self.strategies]
+		cashValue = np.empty((len(self.strategies), dayCount))
+		assetValue = np.empty((len(self.strategies), dayCount))
+		segmentStart = [0] * len(self.strategies)
+		schedule = {}
+		for n, s in enumerate(self.strategies):
+			for day in s.RebalanceDays(dayCount): schedule.setdefault(day, []).append(n)
+		for day in sorted(schedule):
+			for n in schedule[day]:
+				portfolio = portfolios[n]
+				cashValue[n, segmentStart[n]:day] = portfolio.cash
+				assetValue[n, segmentStart[n]:day] = portfolio.AssetValue(segmentStart[n], day)
+				portfolio.SellAll(day)
+				cashValue[n, day] = portfolio.cash
+				assetValue[n, day] = 0
+				indexes, weights = self.strategies[n].targets(self, i0 + day)
+				if self.strategies[n].alignPositions: indexes, weights = self._Orders(indexes, weights)
+				portfolio.BuyIndexes(day, indexes, weights)
+				segmentStart[n] = day + 1
+		results = {}
+		for n, s in enumerate(self.strategies):
+			portfolio = portfolios[n]
+			cashValue[n, segmentStart[n]:] = portfolio.cash
+			assetValue[n, segmentStart[n]:] = portfolio.AssetValue(segmentStart[n], dayCount)
+			portfolio.SellAll(dayCount - 1)
+			cashValue[n, -1] = portfolio.cash
+			assetValue[n, -1] = 0
+			dailyValue = pd.DataFrame({'CashValue':cashValue[n], 'AssetValue':assetValue[n], 'TotalValue':cashValue[n] + assetValue[n]}, index=pd.DatetimeIndex(dates, name='Date'))
+			results[s.modelName] = (dailyValue, portfolio.TradeHistory())
+		return results
+
+def EndingValues(results:dict):
+	#Last TotalValue of each strategy in a Run result, 0 for a strategy without prices
+	return pd.Series({modelName:(dailyValue['TotalValue'].iloc[-1] if len(dailyValue) > 0 else 0) for modelName, (dailyValue, trades) in results.items()})
@@ -1,15 +1,20 @@
-import sys
+import sys, logging
 import pandas as pd
 from _classes.PriceTradeAnalyzer import TradingModel, PricingData, StockPicker
 from _classes.TickerLists import TickerLists
 from _classes.Utility import *
+from ParameterSweep import RunSweep, SummarizeSweep
+from BaselineCache import RunBuyHoldCached, GetBaselineCache
+from ResultStore import AttachResultStore
+from LiveTracker import LiveTracker
+from Profiling import logger, Phase, Count, StartRun, EndRun, EnableProfiling, ProfileSummary, ConfigureLogging
 
 def RunBuyHold(ticker: str, startDate:str, durationInYears:int, ReEvaluationInterval:int=20, portfolioSize:int=30000, verbose:bool=False):
 	#Baseline model to compare against.  Buy on day one, hold for the duration and then sell
 	modelName = 'BuyHold_' + (ticker) + '_' + startDate[-4:]
 	tm = TradingModel(modelName=modelName, startingTicker=ticker, startDate=startDate, durationInYears=durationInYears, totalFunds=portfolioSize, tranchSize=portfolioSize/10, verbose=verbose)
 	if not tm.modelReady:
-		print('Unable to initialize price history for model BuyHold date ' + str(startDate))
+		logger.warning('Unable to initialize price history for model BuyHold date ' + str(startDate))
 		return 0
 	else:
 		dayCounter =0
@@ -23,64 +28,80 @@ def RunBuyHold(ticker: str, startDate:str, durationInYears:int, ReEvaluationInte
 			if dayCounter >= ReEvaluationInterval: dayCounter=0
 			tm.ProcessDay()
 		cash, asset = tm.Value()
-		print('Ending Value: ', cash + asset, '(Cash', cash, ', Asset', asset, ')')
+		logger.info('%s Ending Value: %s (Cash %s, Asset %s)', modelName, cash + asset, cash, asset)
 		return tm.CloseModel(plotResults=False, saveHistoryToFile=verbose)	
 
-def RunPriceMomentum(tickerList:list, startDate:str='1/1/1982', durationInYears:int=36, stockCount:int=9, ReEvaluationInterval:int=20, filterOption:int=3, longHistory:int=365, shortHistory:int=90, minPercentGain=0.05, portfolioSize:int=30000, returndailyValues:bool=False, verbose:bool=False):
+def RunBuyHoldMemo(ticker: str, startDate:str, durationInYears:int, ReEvaluationInterval:int=20, portfolioSize:int=30000, verbose:bool=False):
+	#RunBuyHold's own ending value kept on disk by its inputs and the price file version, the default baseline of the comparisons and sweeps
+	if verbose: return RunBuyHold(ticker, startDate, durationInYears, ReEvaluationInterval, portfolioSize, verbose)
+	return GetBaselineCache().Model('PriceMomentumTrader.RunBuyHold', RunBuyHold, ticker, startDate, durationInYears, ReEvaluationInterval, portfolioSize)
+
+def RunPriceMomentum(tickerList:list, startDate:str='1/1/1982', durationInYears:int=36, stockCount:int=9, ReEvaluationInterval:int=20, filterOption:int=3, longHistory:int=365, shortHistory:int=90, minPercentGain=0.05, portfolioSize:int=30000, returndailyValues:bool=False, picker=None, verbose:bool=False):
 	#Choose stockCount stocks with the greatest long term (longHistory days) price appreciation, using different filter options defined in the StockPicker class
 	#shortHistory is a shorter time frame (like 90 days) used differently by different filters
 	#ReEvaluationInterval is how often to re-evaluate our choices, ideally this should be very short and not matter, otherwise the date selection is biased.
 	allocateByPointValue=True
 	startDate = ToDate(startDate)
 	endDate =  AddDays(startDate, 365 * durationInYears)
-	picker = StockPicker(AddDays(startDate, -730), endDate) #Include earlier dates for statistics
-	for t in tickerList:
-		picker.AddTicker(t)
+	StartRun()
+	if picker is None: #A sweep passes in one picker shared by many runs
+		with Phase('PickerConstruction'):
+			picker = StockPicker(AddDays(startDate, -730), endDate) #Include earlier dates for statistics
+			for t in tickerList:
+				picker.AddTicker(t)
 	tm = TradingModel(modelName='PriceMomentumShort_longHistory_' + str(longHistory) +'_shortHistory_' + str(shortHistory) + '_reeval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount) + '_filter' + str(filterOption) + '_' + str(minPercentGain), startingTicker='.INX', startDate=startDate, durationInYears=durationInYears, totalFunds=portfolioSize, tranchSize=portfolioSize/stockCount, verbose=verbose)
 	dayCounter = 0
 	if not tm.modelReady:
-		print('Unable to initialize price history for PriceMomentum date ' + str(startDate))
+		logger.warning('Unable to initialize price history for PriceMomentum date ' + str(startDate))
 		return 0
 	else:
 		while not tm.ModelCompleted():
 			currentDate =  tm.currentDate
 			if dayCounter ==0:
-				print('\n')
-				print(currentDate)
-				c, a = tm.Value()
-				print(tm.modelName, int(c), int(a), int(c+a))
-				print('available/buy/sell/long',tm.PositionSummary())
-				candidates = picker.GetHighestPriceMomentum(currentDate, longHistoryDays=longHistory, shortHistoryDays=shortHistory, stocksToReturn=stockCount, filterOption=filterOption, minPercentGain=minPercentGain)
-				if allocateByPointValue:
-					print('Allocating by point value')
-					candidates = pd.DataFrame(candidates.groupby(['Ticker'])['Point_Value'].sum()) #Group by ticker, sum Point_Value and call that TargetHoldings
-					candidates.rename(columns={'Point_Value':'TargetHoldings'}, inplace=True)
-				else:
-					print('Allocating evenly')
-					candidates = pd.DataFrame(candidates.groupby(['Ticker']).size()) #Group by ticker with new colum for TargetHoldings, .size=count; .sum=sum, keeps only the index and the count
-					candidates.rename(columns={0:'TargetHoldings'}, inplace=True)
-				tm.AlignPositions(targetPositions=candidates)
-			tm.ProcessDay()
+				if logger.isEnabledFor(logging.INFO): #Value and PositionSummary are only worth their cost when someone reads them
+					c, a = tm.Value()
+					logger.info('%s %s %d %d %d available/buy/sell/long %s', currentDate, tm.modelName, c, a, c+a, tm.PositionSummary())
+				with Phase('GetHighestPriceMomentum'):
+					candidates = picker.GetHighestPriceMomentum(currentDate, longHistoryDays=longHistory, shortHistoryDays=shortHistory, stocksToReturn=stockCount, filterOption=filterOption, minPercentGain=minPercentGain)
+				with Phase('TargetHoldings'):
+					if allocateByPointValue:
+						logger.debug('Allocating by point value')
+						candidates = pd.DataFrame(candidates.groupby(['Ticker'])['Point_Value'].sum()) #Group by ticker, sum Point_Value and call that TargetHoldings
+						candidates.rename(columns={'Point_Value':'TargetHoldings'}, inplace=True)
+					else:
+						logger.debug('Allocating evenly')
+						candidates = pd.DataFrame(candidates.groupby(['Ticker']).size()) #Group by ticker with new colum for TargetHoldings, .size=count; .sum=sum, keeps only the index and the count
+						candidates.rename(columns={0:'TargetHoldings'}, inplace=True)
+				with Phase('AlignPositions'):
+					tm.AlignPositions(targetPositions=candidates)
+				Count('Rebalances')
+			with Phase('ProcessDay'):
+				tm.ProcessDay()
 			dayCounter+=1
 			if dayCounter >= ReEvaluationInterval: dayCounter=0
 
-		cv1 = tm.CloseModel(plotResults=False, saveHistoryToFile=((durationInYears>1) or verbose))
+		with Phase('CloseModel'):
+			cv1 = tm.CloseModel(plotResults=False, saveHistoryToFile=((durationInYears>1) or verbose))
+		EndRun(tm.modelName, startDate, durationInYears, (durationInYears>1) or verbose)
 		if returndailyValues:
 			return tm.GetDailyValue()
 		else:
 			return cv1
 			
-def ComparePMToBH(startYear:int=1982, endYear:int=2018, durationInYears:int=1, stockCount:int=9, ReEvaluationInterval:int=20, filterOption:int=3, longHistory:int=365, shortHistory:int=90):
+def ComparePMToBH(startYear:int=1982, endYear:int=2018, durationInYears:int=1, stockCount:int=9, ReEvaluationInterval:int=20, filterOption:int=3, longHistory:int=365, shortHistory:int=90, cachedBaseline:bool=False):
 	#Compares the PriceMomentum strategy to BuyHold in one year intervals, outputs the returns to .csv file
 	modelOneName = 'BuyHold'
 	modelTwoName = 'PriceMomentum_longHistory_' + str(longHistory) +'_shortHistory_' + str(shortHistory) + '_ReEval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount) + '_filter' + str(filterOption)
 	portfolioSize=30000
+	#The baseline is RunBuyHold memoized on disk.  cachedBaseline computes BuyHold from the price series instead, it is opt in until it has been
+	#checked against the BuyHoldEndingValue of the Compare csvs in Data/, which needs the recorded .INX history
+	baseline = RunBuyHoldCached if cachedBaseline else RunBuyHoldMemo
 	TestResults = pd.DataFrame(columns=list(['StartDate','Duration', modelOneName + 'EndingValue',  'ModelEndingValue', modelOneName + 'Gain', 'ModelGain', 'Difference']))
 	TestResults.set_index(['StartDate'], inplace=True)		
 	trials = int((endYear - startYear)/durationInYears) 
 	for i in range(trials):
 		startDate = '1/2/' + str(startYear + i * durationInYears)
-		m1ev = RunBuyHold('.INX', startDate=startDate, durationInYears=durationInYears, ReEvaluationInterval=ReEvaluationInterval, portfolioSize=portfolioSize)
+		m1ev = baseline('.INX', startDate=startDate, durationInYears=durationInYears, ReEvaluationInterval=ReEvaluationInterval, portfolioSize=portfolioSize)
 		m2ev = RunPriceMomentum(tickerList = TickerLists.AllTopPerformers(), startDate=startDate, durationInYears=durationInYears, stockCount=stockCount, ReEvaluationInterval=ReEvaluationInterval, filterOption=filterOption,  longHistory=longHistory, shortHistory=shortHistory, portfolioSize=portfolioSize, returndailyValues=False, verbose=False)
 		m1pg = (m1ev/portfolioSize) - 1 
 		m2pg = (m2ev/portfolioSize) - 1
@@ -89,42 +110,59 @@ def ComparePMToBH(startYear:int=1982, endYear:int=2018, durationInYears:int=1, s
 	TestResults.to_csv('data/trademodel/Compare' + modelOneName + '_to_' + modelTwoName + '_year ' + str(startYear) + '_duration' + str(durationInYears) +'.csv')
 	print(TestResults)
 
-def ExtensiveTesting1():
+def ExtensiveTesting1(workers:int=1):
 	#Helper subroutine for running multiple tests
 	RunPriceMomentum(tickerList = tickers, startDate='1/1/1982', durationInYears=36, stockCount=5, ReEvaluationInterval=20, filterOption=2, longHistory=365, shortHistory=30) 
-	ComparePMToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=20, stockCount=9, filterOption=3, longHistory=365, shortHistory=90) 
+	grid = {'ReEvaluationInterval':[20], 'stockCount':[9], 'filterOption':[3], 'longHistory':[365], 'shortHistory':[90]}
+	print(SummarizeSweep(RunSweep(RunPriceMomentum, RunBuyHoldMemo, TickerLists.AllTopPerformers(), grid, startYear=1982, endYear=2018, durationInYears=1, workers=workers)))
 
-def ExtensiveTesting2():
+def ExtensiveTesting2(workers:int=1):
 	#Helper subroutine for running multiple tests
-	ComparePMToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=20, stockCount=9, filterOption=2, longHistory=120, shortHistory=90) 
-	ComparePMToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=20, stockCount=9, filterOption=2, longHistory=180, shortHistory=90) 
-	ComparePMToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=20, stockCount=9, filterOption=2, longHistory=240, shortHistory=90) 
+	grid = {'ReEvaluationInterval':[20], 'stockCount':[9], 'filterOption':[2], 'longHistory':[120, 180, 240], 'shortHistory':[90]}
+	print(SummarizeSweep(RunSweep(RunPriceMomentum, RunBuyHoldMemo, TickerLists.AllTopPerformers(), grid, startYear=1982, endYear=2018, durationInYears=1, workers=workers)))
 
-def ExtensiveTesting3():
+def ExtensiveTesting3(workers:int=1):
 	#Helper subroutine for running multiple tests
-	ComparePMToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=20, stockCount=9, filterOption=1, longHistory=365, shortHistory=90) 
-	ComparePMToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=20, stockCount=9, filterOption=3, longHistory=365, shortHistory=90) 
-	ComparePMToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=20, stockCount=9, filterOption=4, longHistory=365, shortHistory=90) 
+	grid = {'ReEvaluationInterval':[20], 'stockCount':[9], 'filterOption':[1, 3, 4], 'longHistory':[365], 'shortHistory':[90]}
+	print(SummarizeSweep(RunSweep(RunPriceMomentum, RunBuyHoldMemo, TickerLists.AllTopPerformers(), grid, startYear=1982, endYear=2018, durationInYears=1, workers=workers)))
 	
-def ModelPastYear():
+def ModelPastYear(incremental:bool=False):
 	#Show how each strategy performs on the past years data
+	#incremental uses LiveTracker, whose picks come from the PriceSignals filters and stay opt in until tests/test_signal_picker.py has passed with the library's StockPicker
 	startDate = AddDays(GetTodaysDate(), -370)
+	if incremental: #Picks up from the last saved state and only processes the days added since, the first call starts the model a year back
+		tracker = LiveTracker(tickerList = tickers, stockCount=5, ReEvaluationInterval=20)
+		dailyValue = tracker.Update(startDate=startDate)
+		print(tracker.modelName, 'processed', len(dailyValue), 'new days')
+		if len(dailyValue) > 0: print(dailyValue.tail(1))
+		print(tracker.PositionSummary())
+		daysUntil, targets = tracker.NextRebalance()
+		print('Next rebalance in', daysUntil, 'days, current targets:')
+		print(targets)
+		RunBuyHold(ticker='.INX', startDate=startDate, durationInYears=1)
+		return
 	RunPriceMomentum(tickerList = tickers, startDate=startDate, durationInYears=1, stockCount=5, ReEvaluationInterval=20, verbose=True)
 	RunBuyHold(ticker='.INX', startDate=startDate, durationInYears=1)
 
 if __name__ == '__main__':
 	switch = 0
-	if len(sys.argv[1:]) > 0: switch = sys.argv[1:][0]
+	workers = 1
+	args = [a for a in sys.argv[1:] if not a.startswith('--')]
+	if len(args) > 0: switch = args[0]
+	if len(args) > 1: workers = int(args[1]) #Optional second argument runs sweeps across a process pool
+	ConfigureLogging(logging.WARNING if '--quiet' in sys.argv else logging.INFO)
+	if '--profile' in sys.argv: EnableProfiling() #Phase timing breakdown saved with each run's results
+	if '--store' in sys.argv: AttachResultStore() #Timing breakdowns go to the compressed store in data/results/ instead of csv files
 	tickers = TickerLists.SPTop70()
 	if switch == '1':
 		print('Running option: ', switch)
-		ExtensiveTesting1()
+		ExtensiveTesting1(workers)
 	elif switch == '2':
 		print('Running option: ', switch)
-		ExtensiveTesting2()
+		ExtensiveTesting2(workers)
 	elif switch == '3':
 		print('Running option: ', switch)
-		ExtensiveTesting3()
+		ExtensiveTesting3(workers)
 	elif switch == '4':
 		print('Running option: ', switch)
 		ModelPastYear()
@@ -136,3 +174,4 @@ if __name__ == '__main__':
 		ComparePMToBH(startYear=2000,endYear=2018, durationInYears=1, ReEvaluationInterval=20, stockCount=5, filterOption=1, longHistory=365, shortHistory=60) #Runs the model in one year intervals, comparing each to BuyHold
 		#ComparePMToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=20, stockCount=5, filterOption=2, longHistory=365, shortHistory=60) #Runs the model in one year intervals, comparing each to BuyHold
 		#ComparePMToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=20, stockCount=5, filterOption=4, longHistory=365, shortHistory=60) #Runs the model in one year intervals, comparing each to BuyHold
+	if '--profile' in sys.argv: print(ProfileSummary())
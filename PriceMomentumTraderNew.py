@@ -1,15 +1,43 @@
-import sys
+import sys, logging
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from _classes.PriceTradeAnalyzer import TradingModel, PricingData, StockPicker
 from _classes.TickerLists import TickerLists
 from _classes.Utility import *
+from PricePanel import GetPricePanel, AttachPricePanel, PanelPricingData
+from PriceSignals import CreateSignalPicker, SignalPicker
+from VectorBacktest import RunVectorBacktest, SaveVectorBacktest, RebalanceDays
+from BaselineCache import RunBuyHoldCached, GetBaselineCache
+from ResultStore import ActiveResultStore, StoreModelHistory, AttachResultStore
+from PortfolioSet import PortfolioSet, BuyHoldStrategy, PriceMomentumStrategy, BlendedStrategy, PointValueStrategy, EndingValues
+from MonteCarlo import RunMonteCarlo, SummarizeMonteCarlo
+from WalkForward import WalkForward, SummarizeWalkForward
+from Profiling import logger, Phase, Count, StartRun, EndRun, EnableProfiling, ProfileSummary, ConfigureLogging
+
+def UseSharedPrices():
+	#Loads SPTop70 and the index once into the shared price panel, every StockPicker and TradingModel created afterwards reads its history from it.
+	#Opt in with --sharedPrices, PanelPricingData has not been checked against the library loader and drops Volume
+	AttachPricePanel(GetPricePanel(TickerLists.SPTop70() + ['.INX']))
+
+def CreatePicker(tickerList:list, startDate, endDate, useSignals:bool=False):
+	#useSignals picks from signal matrices precomputed over the shared price panel instead of StockPicker recomputing every ticker on every rebalance.
+	#It stays opt in until the StockPicker comparison in tests/test_signal_picker.py has passed with the library's StockPicker
+	with Phase('PickerConstruction'):
+		if useSignals:
+			picker = CreateSignalPicker(tickerList, startDate, endDate)
+		else:
+			picker = StockPicker(startDate, endDate)
+		for t in tickerList:
+			picker.AddTicker(t)
+	return picker
 
 def RunBuyHold(ticker: str, startDate:str, durationInYears:int, ReEvaluationInterval:int=20, portfolioSize:int=30000, verbose:bool=False):
 	#Baseline model to compare against.  Buy on day one, hold for the duration and then sell
 	modelName = 'BuyHold_' + (ticker) + '_' + startDate[-4:]
 	tm = TradingModel(modelName=modelName, startingTicker=ticker, startDate=startDate, durationInYears=durationInYears, totalFunds=portfolioSize, tranchSize=portfolioSize/10, verbose=verbose)
 	if not tm.modelReady:
-		print('Unable to initialize price history for model BuyHold date ' + str(startDate))
+		logger.warning('Unable to initialize price history for model BuyHold date ' + str(startDate))
 		return 0
 	else:
 		dayCounter =0
@@ -23,8 +51,15 @@ def RunBuyHold(ticker: str, startDate:str, durationInYears:int, ReEvaluationInte
 			if dayCounter >= ReEvaluationInterval: dayCounter=0
 			tm.ProcessDay()
 		cash, asset = tm.Value()
-		print('Ending Value: ', cash + asset, '(Cash', cash, ', Asset', asset, ')')
-		return tm.CloseModel(plotResults=False, saveHistoryToFile=verbose)	
+		logger.info('%s Ending Value: %s (Cash %s, Asset %s)', modelName, cash + asset, cash, asset)
+		cv1 = tm.CloseModel(plotResults=False, saveHistoryToFile=verbose)
+		if verbose: StoreModelHistory(modelName, startDate, durationInYears, tm.GetDailyValue())
+		return cv1
+
+def RunBuyHoldMemo(ticker: str, startDate:str, durationInYears:int, ReEvaluationInterval:int=20, portfolioSize:int=30000, verbose:bool=False):
+	#RunBuyHold's own ending value kept on disk by its inputs and the price file version, the default baseline of the Compare functions
+	if verbose: return RunBuyHold(ticker, startDate, durationInYears, ReEvaluationInterval, portfolioSize, verbose)
+	return GetBaselineCache().Model('PriceMomentumTraderNew.RunBuyHold', RunBuyHold, ticker, startDate, durationInYears, ReEvaluationInterval, portfolioSize)
 
 def RunBuyHoldList(tickerList:list, startDate:str, durationInYears:int, portfolioSize:int=30000, verbose:bool=False):
 	#Alternative option to use Buy Hold strategy with a list of tickers
@@ -32,7 +67,7 @@ def RunBuyHoldList(tickerList:list, startDate:str, durationInYears:int, portfoli
 	modelName = 'BuyHold_tickerList_count' + str(c) + '_' + startDate[-4:]
 	tm = TradingModel(modelName=modelName, startingTicker=tickerList[0], startDate=startDate, durationInYears=durationInYears, totalFunds=portfolioSize, tranchSize=portfolioSize/c)
 	if not tm.modelReady:
-		print('Unable to initialize price history for BuyHoldList date ' + str(startDate))
+		logger.warning('Unable to initialize price history for BuyHoldList date ' + str(startDate))
 		return 0
 	else:
 		for t in tickerList:
@@ -40,48 +75,115 @@ def RunBuyHoldList(tickerList:list, startDate:str, durationInYears:int, portfoli
 		while not tm.ModelCompleted():
 			tm.ProcessDay()
 		cash, asset = tm.Value()
-		print('Ending Value: ', cash + asset, '(Cash', cash, ', Asset', asset, ')')
-		return tm.CloseModel(plotResults=False, saveHistoryToFile=verbose)	
+		logger.info('%s Ending Value: %s (Cash %s, Asset %s)', modelName, cash + asset, cash, asset)
+		cv1 = tm.CloseModel(plotResults=False, saveHistoryToFile=verbose)
+		if verbose: StoreModelHistory(modelName, startDate, durationInYears, tm.GetDailyValue())
+		return cv1
+
+def PriceMomentumTargets(picker, currentDate, stockCount:int=9, filterOption:int=3, longHistory:int=365, shortHistory:int=90, minPercentGain=0.05):
+	#TargetHoldings for AlignPositions, the picks are allocated evenly
+	with Phase('GetHighestPriceMomentum'):
+		candidates = picker.GetHighestPriceMomentum(currentDate, longHistoryDays=longHistory, shortHistoryDays=shortHistory, stocksToReturn=stockCount, filterOption=filterOption, minPercentGain=minPercentGain)
+	with Phase('TargetHoldings'):
+		candidates = pd.DataFrame(candidates.groupby(['Ticker']).size()) #Group by ticker with new colum for TargetHoldings, .size=count; .sum=sum, keeps only the index and the count
+		candidates.rename(columns={0:'TargetHoldings'}, inplace=True)
+	return candidates
+
+def BlendedTargets(picker, currentDate, longHistory:int=365, shortHistory:int=90, minPercentGain=0.05):
+	with Phase('GetHighestPriceMomentum'):
+		list1 = picker.GetHighestPriceMomentum(currentDate, longHistoryDays=longHistory, shortHistoryDays=shortHistory, stocksToReturn=2, filterOption=3, minPercentGain=minPercentGain)
+	with Phase('GetHighestPriceMomentum'):
+		list3 = picker.GetHighestPriceMomentum(currentDate, longHistoryDays=longHistory, shortHistoryDays=shortHistory, stocksToReturn=2, filterOption=44, minPercentGain=minPercentGain)
+	with Phase('TargetHoldings'):
+		candidates = pd.concat([list1, list1, list3], sort=True) #filter 3 is weighted twice
+		candidates = pd.DataFrame(candidates.groupby(['Ticker']).size()) #Group by ticker with new colum for TargetHoldings, .size=count; .sum=sum, keeps only the index and the count
+		candidates.rename(columns={0:'TargetHoldings'}, inplace=True)
+	return candidates
 
-def RunPriceMomentum(tickerList:list, startDate:str='1/1/1982', durationInYears:int=36, stockCount:int=9, ReEvaluationInterval:int=20, filterOption:int=3, longHistory:int=365, shortHistory:int=90, minPercentGain=0.05, portfolioSize:int=30000, returndailyValues:bool=False, verbose:bool=False):
+def PointValueTargets(picker, currentDate, stockCount:int=9, minPercentGain=0.05):
+	with Phase('GetHighestPriceMomentum'):
+		candidates = picker.GetHighestPriceMomentum(currentDate, stocksToReturn=stockCount, minPercentGain=minPercentGain, filterOption=5)
+	with Phase('TargetHoldings'):
+		candidates = pd.DataFrame(candidates.groupby(['Ticker'])['Point_Value'].sum()) #Group by ticker, sum Point_Value and call that TargetHoldings
+		candidates.rename(columns={'Point_Value':'TargetHoldings'}, inplace=True)
+	return candidates
+
+def RunModelVectorized(modelName:str, tickerList:list, picker, targetFunction, startDate, durationInYears:int, ReEvaluationInterval:int, portfolioSize:int, tranchSize:float, returndailyValues:bool=False, verbose:bool=False):
+	#Array based run of a strategy over the shared price panel instead of the TradingModel day loop, targetFunction(currentDate) returns the TargetHoldings for a rebalance day.
+	#The picks come from whichever picker is passed in, a SignalPicker brings its own panel
+	panel = picker.panel if isinstance(picker, SignalPicker) else GetPricePanel(list(tickerList) + ['.INX'])
+	endDate =  AddDays(startDate, 365 * durationInYears)
+	i0, i1 = panel.DateRange(startDate, endDate)
+	targets = {}
+	for day in RebalanceDays(i1 - i0, ReEvaluationInterval):
+		currentDate = pd.Timestamp(panel.dates[i0 + day]).to_pydatetime()
+		logger.info('%s %s', currentDate, modelName)
+		targets[currentDate] = targetFunction(currentDate)
+		Count('Rebalances')
+	with Phase('VectorBacktest'):
+		dailyValue, trades = RunVectorBacktest(panel, targets, startDate, endDate, portfolioSize, tranchSize)
+	Count('Days', len(dailyValue))
+	if len(dailyValue) == 0:
+		logger.warning('Unable to initialize price history for ' + modelName + ' date ' + str(startDate))
+		return 0
+	logger.info('%s Ending Value: %s', modelName, dailyValue['TotalValue'].iloc[-1])
+	saveHistory = durationInYears > 1 or verbose
+	if saveHistory:
+		with Phase('CloseModel'):
+			if ActiveResultStore() is None:
+				SaveVectorBacktest(modelName, dailyValue, trades, durationInYears)
+			else:
+				StoreModelHistory(modelName + '_vectorized', startDate, durationInYears, dailyValue, trades)
+	EndRun(modelName + '_vectorized', startDate, durationInYears, saveHistory)
+	if returndailyValues:
+		return dailyValue
+	else:
+		return dailyValue['TotalValue'].iloc[-1]
+
+def RunPriceMomentum(tickerList:list, startDate:str='1/1/1982', durationInYears:int=36, stockCount:int=9, ReEvaluationInterval:int=20, filterOption:int=3, longHistory:int=365, shortHistory:int=90, minPercentGain=0.05, portfolioSize:int=30000, returndailyValues:bool=False, useSignals:bool=False, vectorized:bool=False, picker=None, verbose:bool=False):
 	#Choose stockCount stocks with the greatest long term (longHistory days) price appreciation, using different filter options defined in the StockPicker class
 	#shortHistory is a shorter time frame (like 90 days) used differently by different filters
 	#ReEvaluationInterval is how often to re-evaluate our choices, ideally this should be very short and not matter, otherwise the date selection is biased.
 	startDate = ToDate(startDate)
 	endDate =  AddDays(startDate, 365 * durationInYears)
-	picker = StockPicker(AddDays(startDate, -730), endDate) #Include earlier dates for statistics
-	for t in tickerList:
-		picker.AddTicker(t)
-	tm = TradingModel(modelName='PriceMomentumShort_longHistory_' + str(longHistory) +'_shortHistory_' + str(shortHistory) + '_reeval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount) + '_filter' + str(filterOption) + '_' + str(minPercentGain), startingTicker='.INX', startDate=startDate, durationInYears=durationInYears, totalFunds=portfolioSize, tranchSize=portfolioSize/stockCount, verbose=verbose)
+	StartRun()
+	if picker is None: picker = CreatePicker(tickerList, AddDays(startDate, -730), endDate, useSignals) #Include earlier dates for statistics, a sweep passes in one picker shared by many runs
+	modelName = 'PriceMomentumShort_longHistory_' + str(longHistory) +'_shortHistory_' + str(shortHistory) + '_reeval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount) + '_filter' + str(filterOption) + '_' + str(minPercentGain)
+	if vectorized:
+		return RunModelVectorized(modelName, tickerList, picker, lambda currentDate: PriceMomentumTargets(picker, currentDate, stockCount, filterOption, longHistory, shortHistory, minPercentGain), startDate, durationInYears, ReEvaluationInterval, portfolioSize, portfolioSize/stockCount, returndailyValues, verbose)
+	tm = TradingModel(modelName=modelName, startingTicker='.INX', startDate=startDate, durationInYears=durationInYears, totalFunds=portfolioSize, tranchSize=portfolioSize/stockCount, verbose=verbose)
 	dayCounter = 0
 	if not tm.modelReady:
-		print('Unable to initialize price history for PriceMomentum date ' + str(startDate))
+		logger.warning('Unable to initialize price history for PriceMomentum date ' + str(startDate))
 		return 0
 	else:
 		while not tm.ModelCompleted():
 			currentDate =  tm.currentDate
 			if dayCounter ==0:
-				print('\n')
-				print(currentDate)
-				c, a = tm.Value()
-				print(tm.modelName, int(c), int(a), int(c+a))
-				print('available/buy/sell/long',tm.PositionSummary())
-				candidates = picker.GetHighestPriceMomentum(currentDate, longHistoryDays=longHistory, shortHistoryDays=shortHistory, stocksToReturn=stockCount, filterOption=filterOption, minPercentGain=minPercentGain)
-				print('Allocating evenly')
-				candidates = pd.DataFrame(candidates.groupby(['Ticker']).size()) #Group by ticker with new colum for TargetHoldings, .size=count; .sum=sum, keeps only the index and the count
-				candidates.rename(columns={0:'TargetHoldings'}, inplace=True)
-				tm.AlignPositions(targetPositions=candidates)
-			tm.ProcessDay()
+				if logger.isEnabledFor(logging.INFO): #Value and PositionSummary are only worth their cost when someone reads them
+					c, a = tm.Value()
+					logger.info('%s %s %d %d %d available/buy/sell/long %s', currentDate, tm.modelName, c, a, c+a, tm.PositionSummary())
+				logger.debug('Allocating evenly')
+				candidates = PriceMomentumTargets(picker, currentDate, stockCount, filterOption, longHistory, shortHistory, minPercentGain)
+				with Phase('AlignPositions'):
+					tm.AlignPositions(targetPositions=candidates)
+				Count('Rebalances')
+			with Phase('ProcessDay'):
+				tm.ProcessDay()
 			dayCounter+=1
 			if dayCounter >= ReEvaluationInterval: dayCounter=0
 
-		cv1 = tm.CloseModel(plotResults=False, saveHistoryToFile=((durationInYears>1) or verbose))
+		saveHistory = (durationInYears>1) or verbose
+		with Phase('CloseModel'):
+			cv1 = tm.CloseModel(plotResults=False, saveHistoryToFile=saveHistory) #The trades are only in the csv, with a result store attached StoreModelHistory imports them from it
+			if saveHistory: StoreModelHistory(modelName, startDate, durationInYears, tm.GetDailyValue())
+		EndRun(modelName, startDate, durationInYears, saveHistory)
 		if returndailyValues:
 			return tm.GetDailyValue()
 		else:
 			return cv1
 
-def RunPriceMomentumBlended(tickerList:list, startDate:str='1/1/1980', durationInYears:int=29, ReEvaluationInterval:int=20, longHistory:int=365, shortHistory:int=90, portfolioSize:int=30000, returndailyValues:bool=False, verbose:bool=False):
+def RunPriceMomentumBlended(tickerList:list, startDate:str='1/1/1980', durationInYears:int=29, ReEvaluationInterval:int=20, longHistory:int=365, shortHistory:int=90, portfolioSize:int=30000, returndailyValues:bool=False, useSignals:bool=False, vectorized:bool=False, picker=None, verbose:bool=False):
 	#Uses blended option for selecting stocks using three different filters, produces the best overall results.
 	#1 long term performer at short term discount
 	#2 long term performer
@@ -90,150 +192,237 @@ def RunPriceMomentumBlended(tickerList:list, startDate:str='1/1/1980', durationI
 	BlendDesc = '3.3.44.PV'
 	startDate = ToDate(startDate)
 	endDate =  AddDays(startDate, 365 * durationInYears)
-	picker = StockPicker(AddDays(startDate, -730), endDate) #Include earlier dates for statistics
+	StartRun()
+	if picker is None: picker = CreatePicker(tickerList, AddDays(startDate, -730), endDate, useSignals) #Include earlier dates for statistics, a sweep passes in one picker shared by many runs
 	stockCount = 11
-	for t in tickerList:
-		picker.AddTicker(t)
-	tm = TradingModel(modelName='PriceMomentum_Blended' + BlendDesc + '_longHistory_' + str(longHistory) +'_shortHistory_' + str(shortHistory) + '_reeval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount), startingTicker='.INX', startDate=startDate, durationInYears=durationInYears, totalFunds=portfolioSize, tranchSize=portfolioSize/stockCount, verbose=verbose)
+	modelName = 'PriceMomentum_Blended' + BlendDesc + '_longHistory_' + str(longHistory) +'_shortHistory_' + str(shortHistory) + '_reeval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount)
+	if vectorized:
+		return RunModelVectorized(modelName, tickerList, picker, lambda currentDate: BlendedTargets(picker, currentDate, longHistory, shortHistory, minPercentGain), startDate, durationInYears, ReEvaluationInterval, portfolioSize, portfolioSize/stockCount, returndailyValues, verbose)
+	tm = TradingModel(modelName=modelName, startingTicker='.INX', startDate=startDate, durationInYears=durationInYears, totalFunds=portfolioSize, tranchSize=portfolioSize/stockCount, verbose=verbose)
 	dayCounter = 0
 	if not tm.modelReady:
-		print('Unable to initialize price history for PriceMomentum date ' + str(startDate))
+		logger.warning('Unable to initialize price history for PriceMomentum date ' + str(startDate))
 		return 0
 	else:
 		while not tm.ModelCompleted():
 			currentDate =  tm.currentDate
 			if dayCounter == 0:
-				print('\n')
-				print(currentDate)
-				c, a = tm.Value()
-				print(tm.modelName, int(c), int(a), int(c+a))
-				print('available/buy/sell/long',tm.PositionSummary())
-				list1 = picker.GetHighestPriceMomentum(currentDate, longHistoryDays=longHistory, shortHistoryDays=shortHistory, stocksToReturn=2, filterOption=3, minPercentGain=minPercentGain)
-				list2 = picker.GetHighestPriceMomentum(currentDate, longHistoryDays=longHistory, shortHistoryDays=shortHistory, stocksToReturn=2, filterOption=3, minPercentGain=minPercentGain)
-				list3 = picker.GetHighestPriceMomentum(currentDate, longHistoryDays=longHistory, shortHistoryDays=shortHistory, stocksToReturn=2, filterOption=44, minPercentGain=minPercentGain)
-				list4 = picker.GetHighestPriceMomentum(currentDate=currentDate, stocksToReturn=5, filterOption=5)
-				candidates = pd.concat([list1, list2, list3], sort=True)
-				print('Allocating evenly')
-				candidates = pd.DataFrame(candidates.groupby(['Ticker']).size()) #Group by ticker with new colum for TargetHoldings, .size=count; .sum=sum, keeps only the index and the count
-				candidates.rename(columns={0:'TargetHoldings'}, inplace=True)
-				tm.AlignPositions(targetPositions=candidates) 
-			tm.ProcessDay()
+				if logger.isEnabledFor(logging.INFO): #Value and PositionSummary are only worth their cost when someone reads them
+					c, a = tm.Value()
+					logger.info('%s %s %d %d %d available/buy/sell/long %s', currentDate, tm.modelName, c, a, c+a, tm.PositionSummary())
+				logger.debug('Allocating evenly')
+				candidates = BlendedTargets(picker, currentDate, longHistory, shortHistory, minPercentGain)
+				with Phase('AlignPositions'):
+					tm.AlignPositions(targetPositions=candidates)
+				Count('Rebalances')
+			with Phase('ProcessDay'):
+				tm.ProcessDay()
 			dayCounter+=1
 			if dayCounter >= ReEvaluationInterval: dayCounter=0
 
-		cv1 = tm.CloseModel(plotResults=False, saveHistoryToFile=((durationInYears>1) or verbose))
+		saveHistory = (durationInYears>1) or verbose
+		with Phase('CloseModel'):
+			cv1 = tm.CloseModel(plotResults=False, saveHistoryToFile=saveHistory) #The trades are only in the csv, with a result store attached StoreModelHistory imports them from it
+			if saveHistory: StoreModelHistory(modelName, startDate, durationInYears, tm.GetDailyValue())
+		EndRun(modelName, startDate, durationInYears, saveHistory)
 		if returndailyValues:
 			return tm.GetDailyValue()
 		else:
 			return cv1
 
-def RunPointValue(tickerList:list, startDate:str='1/1/1982', durationInYears:int=36, stockCount:int=9, ReEvaluationInterval:int=20, minPercentGain=0.05, portfolioSize:int=30000, returndailyValues:bool=False, verbose:bool=False):
+def RunPointValue(tickerList:list, startDate:str='1/1/1982', durationInYears:int=36, stockCount:int=9, ReEvaluationInterval:int=20, minPercentGain=0.05, portfolioSize:int=30000, returndailyValues:bool=False, useSignals:bool=False, vectorized:bool=False, picker=None, verbose:bool=False):
 	startDate = ToDate(startDate)
 	endDate =  AddDays(startDate, 365 * durationInYears)
-	picker = StockPicker(AddDays(startDate, -730), endDate) #Include earlier dates for statistics
-	for t in tickerList:
-		picker.AddTicker(t)
-	tm = TradingModel(modelName='PointValue_reeval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount) + '_' + str(minPercentGain), startingTicker='.INX', startDate=startDate, durationInYears=durationInYears, totalFunds=portfolioSize, tranchSize=2500, verbose=verbose)
+	StartRun()
+	if picker is None: picker = CreatePicker(tickerList, AddDays(startDate, -730), endDate, useSignals) #Include earlier dates for statistics, a sweep passes in one picker shared by many runs
+	modelName = 'PointValue_reeval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount) + '_' + str(minPercentGain)
+	if vectorized:
+		return RunModelVectorized(modelName, tickerList, picker, lambda currentDate: PointValueTargets(picker, currentDate, stockCount, minPercentGain), startDate, durationInYears, ReEvaluationInterval, portfolioSize, 2500, returndailyValues, verbose)
+	tm = TradingModel(modelName=modelName, startingTicker='.INX', startDate=startDate, durationInYears=durationInYears, totalFunds=portfolioSize, tranchSize=2500, verbose=verbose)
 	dayCounter = 0
 	if not tm.modelReady:
-		print('Unable to initialize price history for PointValue date ' + str(startDate))
+		logger.warning('Unable to initialize price history for PointValue date ' + str(startDate))
 		return 0
 	else:
 		while not tm.ModelCompleted():
 			currentDate =  tm.currentDate
 			if dayCounter ==0:
-				print('\n')
-				print(currentDate)
-				c, a = tm.Value()
-				print(tm.modelName, int(c), int(a), int(c+a))
-				print('available/buy/sell/long',tm.PositionSummary())
-				candidates = picker.GetHighestPriceMomentum(currentDate, stocksToReturn=stockCount, minPercentGain=minPercentGain, filterOption=5)
-				print('Allocating by point value')
-				candidates = pd.DataFrame(candidates.groupby(['Ticker'])['Point_Value'].sum()) #Group by ticker, sum Point_Value and call that TargetHoldings
-				candidates.rename(columns={'Point_Value':'TargetHoldings'}, inplace=True)
-				#print(candidates)
-				tm.AlignPositions(targetPositions=candidates)
-			tm.ProcessDay()
+				if logger.isEnabledFor(logging.INFO): #Value and PositionSummary are only worth their cost when someone reads them
+					c, a = tm.Value()
+					logger.info('%s %s %d %d %d available/buy/sell/long %s', currentDate, tm.modelName, c, a, c+a, tm.PositionSummary())
+				logger.debug('Allocating by point value')
+				candidates = PointValueTargets(picker, currentDate, stockCount, minPercentGain)
+				with Phase('AlignPositions'):
+					tm.AlignPositions(targetPositions=candidates)
+				Count('Rebalances')
+			with Phase('ProcessDay'):
+				tm.ProcessDay()
 			dayCounter+=1
 			if dayCounter >= ReEvaluationInterval: dayCounter=0
-		cv1 = tm.CloseModel(plotResults=False, saveHistoryToFile=((durationInYears>1) or verbose))
+		saveHistory = (durationInYears>1) or verbose
+		with Phase('CloseModel'):
+			cv1 = tm.CloseModel(plotResults=False, saveHistoryToFile=saveHistory) #The trades are only in the csv, with a result store attached StoreModelHistory imports them from it
+			if saveHistory: StoreModelHistory(modelName, startDate, durationInYears, tm.GetDailyValue())
+		EndRun(modelName, startDate, durationInYears, saveHistory)
 		if returndailyValues:
 			return tm.GetDailyValue()
 		else:
 			return cv1
 			
-def ComparePMToBH(startYear:int=1982, endYear:int=2018, durationInYears:int=1, stockCount:int=9, ReEvaluationInterval:int=20, filterOption:int=3, longHistory:int=365, shortHistory:int=90):
-	#Compares the PriceMomentum strategy to BuyHold in one year intervals, outputs the returns to .csv file
-	modelOneName = 'BuyHold'
-	modelTwoName = 'PriceMomentum_longHistory_' + str(longHistory) +'_shortHistory_' + str(shortHistory) + '_ReEval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount) + '_filter' + str(filterOption)
+def _RunComparisonTrial(strategy, baseline, startDate:str, durationInYears:int, ReEvaluationInterval:int, portfolioSize:int, strategyArgs:dict):
+	#Runs one BuyHold vs strategy trial.  Returns (startDate, m1ev, m2ev, error) so a bad year is recorded instead of stopping the whole sweep
+	try:
+		m1ev = baseline('.INX', startDate=startDate, durationInYears=durationInYears, ReEvaluationInterval=ReEvaluationInterval, portfolioSize=portfolioSize)
+		m2ev = strategy(tickerList = TickerLists.SPTop70(), startDate=startDate, durationInYears=durationInYears, ReEvaluationInterval=ReEvaluationInterval, portfolioSize=portfolioSize, returndailyValues=False, verbose=False, **strategyArgs)
+		return startDate, m1ev, m2ev, ''
+	except Exception as e:
+		return startDate, None, None, repr(e)
+
+def _RunComparison(modelOneName:str, modelTwoName:str, strategy, strategyArgs:dict, startYear:int, endYear:int, durationInYears:int, ReEvaluationInterval:int, workers:int=1, cachedBaseline:bool=False):
+	#Shared body of the Compare functions.  Trials are independent so with workers > 1 they are fanned out to a process pool, results are gathered back in start date order
 	portfolioSize=30000
+	#The baseline is RunBuyHold memoized on disk.  cachedBaseline computes BuyHold from the price series instead, it is opt in until it has been
+	#checked against the BuyHoldEndingValue of the Compare csvs in Data/, which needs the recorded .INX history
+	baseline = RunBuyHoldCached if cachedBaseline else RunBuyHoldMemo
 	TestResults = pd.DataFrame(columns=list(['StartDate','Duration', modelOneName + 'EndingValue',  'ModelEndingValue', modelOneName + 'Gain', 'ModelGain', 'Difference']))
 	TestResults.set_index(['StartDate'], inplace=True)		
 	trials = int((endYear - startYear)/durationInYears) 
-	for i in range(trials):
-		startDate = '1/2/' + str(startYear + i * durationInYears)
-		m1ev = RunBuyHold('.INX', startDate=startDate, durationInYears=durationInYears, ReEvaluationInterval=ReEvaluationInterval, portfolioSize=portfolioSize)
-		m2ev = RunPriceMomentum(tickerList = TickerLists.SPTop70(), startDate=startDate, durationInYears=durationInYears, stockCount=stockCount, ReEvaluationInterval=ReEvaluationInterval, filterOption=filterOption,  longHistory=longHistory, shortHistory=shortHistory, portfolioSize=portfolioSize, returndailyValues=False, verbose=False)
-		m1pg = (m1ev/portfolioSize) - 1 
-		m2pg = (m2ev/portfolioSize) - 1
-		TestResults.loc[startDate] = [durationInYears, m1ev, m2ev, m1pg, m2pg, m2pg-m1pg]
+	startDates = ['1/2/' + str(startYear + i * durationInYears) for i in range(trials)]
+	if workers > 1 and trials > 1:
+		#Build the panel caches the workers read before starting them, so they only map them
+		if cachedBaseline or strategyArgs.get('useSignals') or strategyArgs.get('vectorized'): GetPricePanel(TickerLists.SPTop70() + ['.INX'])
+		if cachedBaseline and PanelPricingData.panel is None: GetPricePanel(['.INX'])
+		initializer = UseSharedPrices if PanelPricingData.panel is not None else None #When shared prices were turned on, workers map the same on-disk panel rather than reloading histories
+		with ProcessPoolExecutor(max_workers=min(workers, trials), initializer=initializer) as pool:
+			futures = [pool.submit(_RunComparisonTrial, strategy, baseline, startDate, durationInYears, ReEvaluationInterval, portfolioSize, strategyArgs) for startDate in startDates]
+			results = []
+			for startDate, f in zip(startDates, futures):
+				try:
+					results.append(f.result())
+				except Exception as e: #Worker process died, the trial is recorded as failed
+					results.append((startDate, None, None, repr(e)))
+	else:
+		results = [_RunComparisonTrial(strategy, baseline, startDate, durationInYears, ReEvaluationInterval, portfolioSize, strategyArgs) for startDate in startDates]
+	failures = []
+	for startDate, m1ev, m2ev, error in results:
+		if error:
+			failures.append((startDate, error))
+			TestResults.loc[startDate] = [durationInYears, np.nan, np.nan, np.nan, np.nan, np.nan]
+		else:
+			m1pg = (m1ev/portfolioSize) - 1 
+			m2pg = (m2ev/portfolioSize) - 1
+			TestResults.loc[startDate] = [durationInYears, m1ev, m2ev, m1pg, m2pg, m2pg-m1pg]
 	TestResults.sort_values(['Difference'], axis=0, ascending=True, inplace=True)
-	TestResults.to_csv('data/trademodel/Compare' + modelOneName + '_to_' + modelTwoName + '_year ' + str(startYear) + '_duration' + str(durationInYears) +'.csv')
+	if ActiveResultStore() is None:
+		TestResults.to_csv('data/trademodel/Compare' + modelOneName + '_to_' + modelTwoName + '_year ' + str(startYear) + '_duration' + str(durationInYears) +'.csv')
+	else:
+		ActiveResultStore().Append('summary', modelOneName + '_to_' + modelTwoName, TestResults, {'startYear':startYear, 'durationInYears':durationInYears})
 	print(TestResults)
+	for startDate, error in failures:
+		logger.warning('Trial ' + startDate + ' failed: ' + error)
+	return TestResults
+
+def ComparePMToBH(startYear:int=1982, endYear:int=2018, durationInYears:int=1, stockCount:int=9, ReEvaluationInterval:int=20, filterOption:int=3, longHistory:int=365, shortHistory:int=90, useSignals:bool=False, vectorized:bool=False, workers:int=1, cachedBaseline:bool=False):
+	#Compares the PriceMomentum strategy to BuyHold in one year intervals, outputs the returns to .csv file
+	modelOneName = 'BuyHold'
+	modelTwoName = 'PriceMomentum_longHistory_' + str(longHistory) +'_shortHistory_' + str(shortHistory) + '_ReEval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount) + '_filter' + str(filterOption)
+	strategyArgs = {'stockCount':stockCount, 'filterOption':filterOption, 'longHistory':longHistory, 'shortHistory':shortHistory, 'useSignals':useSignals, 'vectorized':vectorized}
+	return _RunComparison(modelOneName, modelTwoName, RunPriceMomentum, strategyArgs, startYear, endYear, durationInYears, ReEvaluationInterval, workers, cachedBaseline)
 
-def CompareBlendedToBH(startYear:int=1982, endYear:int=2018, durationInYears:int = 1, ReEvaluationInterval:int=20, longHistory:int=365, shortHistory:int=90):
+def CompareBlendedToBH(startYear:int=1982, endYear:int=2018, durationInYears:int = 1, ReEvaluationInterval:int=20, longHistory:int=365, shortHistory:int=90, useSignals:bool=False, vectorized:bool=False, workers:int=1, cachedBaseline:bool=False):
 	#Compares the BlendedPriceMomentum strategy to BuyHold in one year intervals, outputs the returns to .csv file
 	stockCount = 11
 	modelOneName = 'BuyHold'
 	BlendDesc = '3.w3.44.PV'
 	modelTwoName = 'PriceMomentumBlended' + BlendDesc
 	modelTwoName += '_longHistory_' + str(longHistory) +'_shortHistory_' + str(shortHistory) + '_ReEval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount)
-	portfolioSize=30000
-	TestResults = pd.DataFrame(columns=list(['StartDate','Duration', modelOneName + 'EndingValue',  'ModelEndingValue', modelOneName + 'Gain', 'ModelGain', 'Difference']))
-	TestResults.set_index(['StartDate'], inplace=True)		
-	trials = int((endYear - startYear)/durationInYears) 
-	for i in range(trials):
-		startDate = '1/2/' + str(startYear + i * durationInYears)
-		m1ev = RunBuyHold('.INX', startDate=startDate, durationInYears=durationInYears, ReEvaluationInterval=ReEvaluationInterval, portfolioSize=portfolioSize)
-		m2ev = RunPriceMomentumBlended(tickerList = TickerLists.SPTop70(), startDate=startDate, durationInYears=durationInYears,  ReEvaluationInterval=ReEvaluationInterval, longHistory=longHistory, shortHistory=shortHistory, portfolioSize=portfolioSize, returndailyValues=False, verbose=False)
-		m1pg = (m1ev/portfolioSize) - 1 
-		m2pg = (m2ev/portfolioSize) - 1
-		TestResults.loc[startDate] = [durationInYears, m1ev, m2ev, m1pg, m2pg, m2pg-m1pg]
-	TestResults.sort_values(['Difference'], axis=0, ascending=True, inplace=True)
-	TestResults.to_csv('data/trademodel/Compare' + modelOneName + '_to_' + modelTwoName + '_year ' + str(startYear) + '_duration' + str(durationInYears) +'.csv')
-	print(TestResults)
+	strategyArgs = {'longHistory':longHistory, 'shortHistory':shortHistory, 'useSignals':useSignals, 'vectorized':vectorized}
+	return _RunComparison(modelOneName, modelTwoName, RunPriceMomentumBlended, strategyArgs, startYear, endYear, durationInYears, ReEvaluationInterval, workers, cachedBaseline)
 
-def ComparePVToBH(startYear:int=1982, endYear:int=2018, durationInYears:int=1, stockCount:int=9, ReEvaluationInterval:int=20):
+def ComparePVToBH(startYear:int=1982, endYear:int=2018, durationInYears:int=1, stockCount:int=9, ReEvaluationInterval:int=20, useSignals:bool=False, vectorized:bool=False, workers:int=1, cachedBaseline:bool=False):
 	modelOneName = 'BuyHold'
 	modelTwoName = 'PointValue_ReEval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount) 
-	portfolioSize=30000
-	TestResults = pd.DataFrame(columns=list(['StartDate','Duration', modelOneName + 'EndingValue',  'ModelEndingValue', modelOneName + 'Gain', 'ModelGain', 'Difference']))
-	TestResults.set_index(['StartDate'], inplace=True)		
+	strategyArgs = {'stockCount':stockCount, 'useSignals':useSignals, 'vectorized':vectorized}
+	return _RunComparison(modelOneName, modelTwoName, RunPointValue, strategyArgs, startYear, endYear, durationInYears, ReEvaluationInterval, workers, cachedBaseline)
+
+def CompareStrategiesToBH(startYear:int=1982, endYear:int=2018, durationInYears:int=1, stockCount:int=9, ReEvaluationInterval:int=20, filterOption:int=3, longHistory:int=365, shortHistory:int=90, strategies:list=None):
+	#Runs BuyHold, PriceMomentum, Blended and PointValue together in one pass per interval instead of one simulation per strategy, outputs each model's gain over BuyHold to .csv file
+	#strategies replaces the default list, the first one is the baseline.  Picks use the unchecked PriceSignals filters, PortfolioSet warns so
+	if strategies is None: strategies = [BuyHoldStrategy('.INX'), PriceMomentumStrategy(stockCount, ReEvaluationInterval, filterOption, longHistory, shortHistory), BlendedStrategy(ReEvaluationInterval, longHistory, shortHistory), PointValueStrategy(stockCount, ReEvaluationInterval)]
+	portfolioSet = PortfolioSet(TickerLists.SPTop70(), strategies)
+	modelOneName = strategies[0].modelName
+	rows = {}
 	trials = int((endYear - startYear)/durationInYears) 
 	for i in range(trials):
 		startDate = '1/2/' + str(startYear + i * durationInYears)
-		m1ev = RunBuyHold('.INX', startDate=startDate, durationInYears=durationInYears, ReEvaluationInterval=ReEvaluationInterval, portfolioSize=portfolioSize)
-		m2ev = RunPointValue(tickerList = TickerLists.SPTop70(), startDate=startDate, durationInYears=durationInYears, stockCount=stockCount, ReEvaluationInterval=ReEvaluationInterval, portfolioSize=portfolioSize, returndailyValues=False, verbose=False)
-		m1pg = (m1ev/portfolioSize) - 1 
-		m2pg = (m2ev/portfolioSize) - 1
-		TestResults.loc[startDate] = [durationInYears, m1ev, m2ev, m1pg, m2pg, m2pg-m1pg]
-	TestResults.sort_values(['Difference'], axis=0, ascending=True, inplace=True)
-	TestResults.to_csv('data/trademodel/Compare' + modelOneName + '_to_' + modelTwoName + '_year ' + str(startYear) + '_duration' + str(durationInYears) +'.csv')
+		endingValues = EndingValues(portfolioSet.Run(startDate, durationInYears))
+		gains = endingValues / np.array([s.portfolioSize for s in strategies]) - 1
+		row = {'Duration':durationInYears}
+		for s in strategies:
+			row[s.modelName + 'EndingValue'] = endingValues[s.modelName]
+			row[s.modelName + 'Gain'] = gains[s.modelName]
+			if s.modelName != modelOneName: row[s.modelName + 'Difference'] = gains[s.modelName] - gains[modelOneName]
+		rows[startDate] = row
+	TestResults = pd.DataFrame.from_dict(rows, orient='index')
+	TestResults.index.name = 'StartDate'
+	if ActiveResultStore() is None:
+		TestResults.to_csv('data/trademodel/CompareStrategies_to_' + modelOneName + '_year ' + str(startYear) + '_duration' + str(durationInYears) +'.csv')
+	else:
+		ActiveResultStore().Append('summary', 'CompareStrategies_to_' + modelOneName, TestResults, {'startYear':startYear, 'durationInYears':durationInYears, 'strategies':[s.modelName for s in strategies]})
 	print(TestResults)
+	return TestResults
+
+def WalkForwardPMToBH(startYear:int=1982, endYear:int=2018, durationInYears:int=1, frequency:str='M', offsets:list=None, stockCount:int=9, ReEvaluationInterval:int=20, filterOption:int=3, longHistory:int=365, shortHistory:int=90):
+	#Like ComparePMToBH with a window starting every month (frequency='W' for every week) instead of every January, offsets=range(ReEvaluationInterval) also tries every rebalance phase
+	#Outputs every window to .csv file and returns the distribution of the differences.  Picks use the unchecked PriceSignals filters, WalkForward warns so
+	if offsets is None: offsets = [0]
+	modelOneName = 'BuyHold'
+	modelTwoName = 'PriceMomentum_longHistory_' + str(longHistory) +'_shortHistory_' + str(shortHistory) + '_ReEval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount) + '_filter' + str(filterOption)
+	walk = WalkForward(TickerLists.SPTop70(), longHistory, shortHistory)
+	TestResults = walk.Run('1/1/' + str(startYear), '1/2/' + str(endYear - durationInYears), durationInYears, frequency, offsets, stockCount, ReEvaluationInterval, filterOption)
+	if ActiveResultStore() is None:
+		TestResults.to_csv('data/trademodel/WalkForward' + modelOneName + '_to_' + modelTwoName + '_' + frequency + '_year ' + str(startYear) + '_duration' + str(durationInYears) +'.csv', index=False)
+	else:
+		ActiveResultStore().Append('summary', 'WalkForward' + modelOneName + '_to_' + modelTwoName + '_' + frequency, TestResults, {'startYear':startYear, 'durationInYears':durationInYears, 'frequency':frequency, 'offsets':list(offsets)})
+	summary = SummarizeWalkForward(TestResults)
+	print(summary)
+	return summary
+
+def MonteCarloPMToBH(scenarios:int=2000, durationInYears:int=1, blockSize:int=20, universeSize:int=50, stockCount:int=9, ReEvaluationInterval:int=20, filterOption:int=3, longHistory:int=365, shortHistory:int=90, seed:int=0, workers:int=1, memoryMB:int=256):
+	#PriceMomentum vs BuyHold over resampled scenarios: block bootstrapped SPTop70 return paths (blockSize=None for historical windows), random rebalance offsets and random universeSize stock subsets
+	#Outputs every scenario to .csv file and returns the distribution of the ending values and of the excess return.  Picks use the unchecked PriceSignals filters, RunMonteCarlo warns so
+	modelOneName = 'BuyHold'
+	modelTwoName = 'PriceMomentum_longHistory_' + str(longHistory) +'_shortHistory_' + str(shortHistory) + '_ReEval_' + str(ReEvaluationInterval) + '_stockcount_' + str(stockCount) + '_filter' + str(filterOption)
+	TestResults = RunMonteCarlo(TickerLists.SPTop70(), scenarios, durationInYears, blockSize, universeSize, True, stockCount, ReEvaluationInterval, filterOption, longHistory, shortHistory, seed=seed, workers=workers, memoryMB=memoryMB)
+	runName = 'MonteCarlo' + modelOneName + '_to_' + modelTwoName + '_block' + str(blockSize) + '_universe' + str(universeSize)
+	if ActiveResultStore() is None:
+		TestResults.to_csv('data/trademodel/' + runName + '_seed' + str(seed) + '_duration' + str(durationInYears) +'.csv', index=False)
+	else:
+		ActiveResultStore().Append('summary', runName, TestResults.rename(columns={'PathStart':'StartDate'}), {'scenarios':scenarios, 'durationInYears':durationInYears, 'seed':seed})
+	summary = SummarizeMonteCarlo(TestResults)
+	print(summary)
+	return summary
 
 if __name__ == '__main__':
 	switch = 0
-	if len(sys.argv[1:]) > 0: switch = sys.argv[1:][0]
+	workers = 1
+	args = [a for a in sys.argv[1:] if not a.startswith('--')]
+	if len(args) > 0: switch = args[0]
+	if len(args) > 1: workers = int(args[1]) #Optional second argument runs Compare trials across a process pool
+	ConfigureLogging(logging.WARNING if '--quiet' in sys.argv else logging.INFO)
+	if '--profile' in sys.argv: EnableProfiling() #Phase timing breakdown saved with each run's results
+	if '--store' in sys.argv: AttachResultStore() #Results go to the compressed store in data/results/ instead of csv files
 	tickers = TickerLists.SPTop70()
+	if '--sharedPrices' in sys.argv: UseSharedPrices()
 	if switch == '1':
 		print('Running option: ', switch)
 		RunPriceMomentum(tickerList = tickers, startDate='1/1/1982', durationInYears=36, stockCount=5, ReEvaluationInterval=20, filterOption=2, longHistory=365, shortHistory=90) 
-		CompareBlendedToBH(startYear=2000,endYear=2010, durationInYears=1, ReEvaluationInterval=5) 
+		CompareBlendedToBH(startYear=2000,endYear=2010, durationInYears=1, ReEvaluationInterval=5, workers=workers) 
 		#CompareBlendedToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=30) 
 		#ComparePMToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=20, stockCount=2, filterOption=3, longHistory=365, shortHistory=90) 
 	elif switch == '2':
 		print('Running option: ', switch)
-		ComparePMToBH(startYear=2000,endYear=2010, durationInYears=1, ReEvaluationInterval=20, stockCount=5, filterOption=2, longHistory=120, shortHistory=60) 
+		ComparePMToBH(startYear=2000,endYear=2010, durationInYears=1, ReEvaluationInterval=20, stockCount=5, filterOption=2, longHistory=120, shortHistory=60, workers=workers) 
 		#ComparePMToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=20, stockCount=5, filterOption=2, longHistory=180, shortHistory=60) 
 		#ComparePMToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=20, stockCount=5, filterOption=2, longHistory=240, shortHistory=60) 
 	elif switch == '3':
@@ -242,12 +431,21 @@ if __name__ == '__main__':
 		#ComparePMToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=20, stockCount=2, filterOption=2, longHistory=365, shortHistory=90) 
 		#CompareBlendedToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=5, longHistory=365, shortHistory=90)
 		#CompareBlendedToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=10, longHistory=365, shortHistory=90)
-		CompareBlendedToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=15, longHistory=365, shortHistory=90)
+		CompareBlendedToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=15, longHistory=365, shortHistory=90, workers=workers)
+	elif switch == '4':
+		print('Running option: ', switch)
+		WalkForwardPMToBH(startYear=1982, endYear=2018, durationInYears=1, frequency='M', offsets=range(20), ReEvaluationInterval=20, stockCount=5, filterOption=2, longHistory=365, shortHistory=90) #Every month and every rebalance phase
+	elif switch == '5':
+		print('Running option: ', switch)
+		CompareStrategiesToBH(startYear=1982, endYear=2018, durationInYears=1, ReEvaluationInterval=20, stockCount=5, filterOption=2, longHistory=365, shortHistory=90) #Every strategy in one pass per year
+	elif switch == '6':
+		print('Running option: ', switch)
+		MonteCarloPMToBH(scenarios=5000, durationInYears=1, blockSize=20, universeSize=50, ReEvaluationInterval=20, stockCount=5, filterOption=2, longHistory=365, shortHistory=90, workers=workers) #Resampled paths, offsets and universes
 	else:
 		tickers = TickerLists.SPTop70()
 		print('Running default option on ' + str(len(tickers)) + ' stocks.')
 		RunBuyHold('.INX', startDate='1/1/1982', durationInYears=36, ReEvaluationInterval=5, portfolioSize=30000, verbose=False)	#Baseline
 		RunPriceMomentum(tickerList = tickers, startDate='1/1/1982', durationInYears=36, stockCount=5, ReEvaluationInterval=20, filterOption=4, longHistory=365, shortHistory=90) #Shows how the strategy works over a long time period
-		ComparePMToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=20, stockCount=5, filterOption=1, longHistory=365, shortHistory=60) #Runs the model in one year intervals, comparing each to BuyHold
+		ComparePMToBH(startYear=1982,endYear=2018, durationInYears=1, ReEvaluationInterval=20, stockCount=5, filterOption=1, longHistory=365, shortHistory=60, workers=workers) #Runs the model in one year intervals, comparing each to BuyHold
 		RunPointValue(tickerList = tickers, startDate='1/1/1982', durationInYears=36, stockCount=5, ReEvaluationInterval=30)
-
+	if '--profile' in sys.argv: print(ProfileSummary())
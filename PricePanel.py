@@ -0,0 +1,275 @@
+import os, json, hashlib, shutil
+import numpy as np
+import pandas as pd
+from _classes import PriceTradeAnalyzer
+from Profiling import logger
+
+#Load-once date x ticker price panel shared by every StockPicker and TradingModel in the process
+#Each field (Open, High, Low, Close) is saved as a ticker x date .npy array so one ticker's history is a contiguous run of floats, date ranges are slices and never copies
+#The arrays are memory mapped from data/panel/ and only rebuilt when a source file in data/historical/ changes.  A cache is built in a temporary folder and
+#moved into place under a file lock, so processes starting together build it once and never see half written files
+#listed is a ticker x date mask of the days from a ticker's first to its last price, so tickers that list and delist over time drop out of selection.
+#dtype='float32' halves the panel for large universes.  Size on disk is about 4 fields x tickers x trading days x 4 bytes plus one byte per cell for listed,
+#for 3000 tickers over 40 years (about 10,080 trading days, 30M cells) that is 121MB per field and 514MB in all, see PanelBytes.  The files are mapped,
+#only the pages read are resident, and building the cache holds one ticker's history at a time.
+historicalFolder = 'data/historical/'
+panelFolder = 'data/panel/'
+priceFields = ['Open','High','Low','Close']
+tradingDaysPerYear = 252
+
+try:
+	import fcntl
+	def _LockFile(f): fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+	def _UnlockFile(f): fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+except ImportError:
+	import msvcrt
+	def _LockFile(f):
+		f.seek(0)
+		while True:
+			try:
+				msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+				return
+			except OSError: #LK_LOCK gives up after 10 seconds, keep waiting for the process building the cache
+				pass
+	def _UnlockFile(f):
+		f.seek(0)
+		msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class _CacheLock():
+	#Exclusive lock on one cache folder across processes, held while a process checks, builds and opens it
+	def __init__(self, cacheFolder:str):
+		self._lockFile = cacheFolder.rstrip('/') + '.lock'
+
+	def __enter__(self):
+		os.makedirs(os.path.dirname(self._lockFile), exist_ok=True)
+		self._file = open(self._lockFile, 'a+')
+		_LockFile(self._file)
+		return self
+
+	def __exit__(self, *exc):
+		_UnlockFile(self._file)
+		self._file.close()
+		return False
+
+def ToDay(d): return np.datetime64(pd.Timestamp(d), 'D')
+
+def SourceFileVersion(fileName:str):
+	#Size and modified time of a price file, changes whenever the file is rewritten
+	if not os.path.isfile(fileName): return 'missing'
+	s = os.stat(fileName)
+	return str(s.st_size) + '_' + str(s.st_mtime_ns)
+
+def PanelBytes(tickerCount:int, years:int, dtype:str='float64'):
+	#Size of a panel's cache files, the upper bound on the memory it can map
+	cells = tickerCount * years * tradingDaysPerYear
+	return cells * (len(priceFields) * np.dtype(dtype).itemsize + 1)
+
+class PricePanel():
+	def __init__(self, tickerList:list, dataFolder:str=historicalFolder, cacheFolder:str=panelFolder, dtype:str='float64', verbose:bool=False):
+		self.tickers = list(dict.fromkeys(tickerList))
+		self._tickerIndex = {t:i for i, t in enumerate(self.tickers)}
+		self._dataFolder = dataFolder
+		self._verbose = verbose
+		self.dtype = np.dtype(dtype).name
+		#Rows follow the order of tickerList, so the order is part of the cache key and matches the ticker list saved in the manifest
+		key = hashlib.md5((','.join(self.tickers) + ('' if self.dtype == 'float64' else '|' + self.dtype)).encode()).hexdigest()[:12]
+		self._cacheFolder = os.path.join(cacheFolder, key) + '/'
+		self.version = self._SourceVersion()
+		with _CacheLock(self._cacheFolder):
+			if not self._CacheCurrent(): self._UpdateCache()
+			self._OpenCache()
+
+	def _SourceFile(self, ticker:str): return self._dataFolder + ticker + '.csv'
+
+	def _SourceVersion(self):
+		#Fingerprint of the source files, any change in size or modified time invalidates the cache.  tickerVersions keeps the part for each ticker
+		self.tickerVersions = {}
+		for t in sorted(self.tickers):
+			f = self._SourceFile(t)
+			if not os.path.isfile(f):
+				p = PriceTradeAnalyzer.PricingData(t) #Let PricingData fetch the history the usual way, it saves it to data/historical/
+				p.LoadHistory(verbose=self._verbose)
+			self.tickerVersions[t] = SourceFileVersion(f)
+		return hashlib.md5(json.dumps(self.tickerVersions, sort_keys=True).encode()).hexdigest()
+
+	def _Manifest(self):
+		manifestFile = self._cacheFolder + 'manifest.json'
+		if not os.path.isfile(manifestFile): return None
+		with open(manifestFile) as f: return json.load(f)
+
+	def _CacheCurrent(self):
+		manifest = self._Manifest()
+		return manifest is not None and manifest.get('version') == self.version and manifest.get('tickers') == self.tickers and manifest.get('dtype') == self.dtype
+
+	def _ReadHistory(self, ticker:str):
+		prices = pd.read_csv(self._SourceFile(ticker), index_col=0, parse_dates=True)
+		return prices[~prices.index.duplicated(keep='last')].sort_index().reindex(columns=priceFields)
+
+	def _CreateArrays(self, buildFolder:str, dates):
+		np.save(buildFolder + 'dates.npy', dates)
+		shape = (len(self.tickers), len(dates))
+		values = {field:np.lib.format.open_memmap(buildFolder + field + '.npy', mode='w+', dtype=self.dtype, shape=shape) for field in priceFields}
+		listed = np.lib.format.open_memmap(buildFolder + 'listed.npy', mode='w+', dtype=bool, shape=shape)
+		return values, listed
+
+	def _WriteRow(self, values:dict, listed, ticker:str, prices, dates):
+		#One ticker's prices reindexed to the panel's dates
+		i = self._tickerIndex[ticker]
+		prices = prices.reindex(pd.DatetimeIndex(dates))
+		for field in priceFields: values[field][i] = prices[field].values
+		self._SetListed(values, listed, i)
+
+	def _SetListed(self, values:dict, listed, i:int):
+		#Listed from the ticker's first to its last price
+		listed[i] = False
+		valid = np.flatnonzero(~np.isnan(values['Close'][i]))
+		if len(valid) > 0: listed[i, valid[0]:valid[-1] + 1] = True
+
+	def _NewBuildFolder(self):
+		buildFolder = self._cacheFolder.rstrip('/') + '.build' + str(os.getpid()) + '/'
+		shutil.rmtree(buildFolder, ignore_errors=True)
+		os.makedirs(buildFolder)
+		return buildFolder
+
+	def _ReplaceCache(self, buildFolder:str):
+		#Saves the manifest and swaps the build folder in.  A folder can't be replaced while it has files, move the old cache aside first.  Processes still mapping it keep their pages
+		with open(buildFolder + 'manifest.json', 'w') as f: json.dump({'version':self.version, 'tickers':self.tickers, 'dtype':self.dtype, 'tickerVersions':self.tickerVersions}, f)
+		cacheFolder = self._cacheFolder.rstrip('/')
+		oldFolder = cacheFolder + '.old' + str(os.getpid())
+		if os.path.isdir(cacheFolder): os.replace(cacheFolder, oldFolder)
+		os.replace(buildFolder, cacheFolder)
+		shutil.rmtree(oldFolder, ignore_errors=True)
+
+	def _UpdateCache(self):
+		#When the cache was built from the same tickers, only the csv files that changed since, such as the histories LiveTracker refreshed, are read again.
+		#The other tickers' rows are copied from the cached arrays, and days the changed files add are appended to them.  Anything else is a full build
+		manifest = self._Manifest()
+		if manifest is None or manifest.get('tickers') != self.tickers or manifest.get('dtype') != self.dtype or not 'tickerVersions' in manifest: return self._BuildCache()
+		changed = [t for t in self.tickers if manifest['tickerVersions'].get(t) != self.tickerVersions[t]]
+		logger.info('Updating price panel cache for ' + str(len(changed)) + ' changed tickers in ' + self._cacheFolder)
+		histories = {t:self._ReadHistory(t) for t in changed if os.path.isfile(self._SourceFile(t))}
+		oldDates = np.load(self._cacheFolder + 'dates.npy')
+		dates = pd.DatetimeIndex(oldDates)
+		for prices in histories.values(): dates = dates.union(prices.index)
+		dates = dates.values.astype('datetime64[D]')
+		columns = np.searchsorted(dates, oldDates)
+		appended = np.array_equal(columns, np.arange(len(oldDates)))
+		if appended: columns = slice(0, len(oldDates))
+		buildFolder = self._NewBuildFolder()
+		values, listed = self._CreateArrays(buildFolder, dates)
+		for field in priceFields:
+			values[field][:] = np.nan
+			values[field][:, columns] = np.load(self._cacheFolder + field + '.npy', mmap_mode='r')
+		listed[:, columns] = np.load(self._cacheFolder + 'listed.npy', mmap_mode='r')
+		for t in self.tickers:
+			i = self._tickerIndex[t]
+			if t in histories:
+				self._WriteRow(values, listed, t, histories[t], dates)
+			elif t in changed: #The csv is gone
+				for field in priceFields: values[field][i] = np.nan
+				listed[i] = False
+			elif not appended: #Days were inserted between cached days, which can fall inside the ticker's listed range
+				self._SetListed(values, listed, i)
+		for array in list(values.values()) + [listed]: array.flush()
+		del values, listed
+		self._ReplaceCache(buildFolder)
+
+	def _BuildCache(self):
+		#Two passes over the csv files, the first collects the trading days and the second writes each ticker's row straight into the mapped arrays.
+		#Everything is written to a temporary folder that replaces the cache folder once the manifest is saved, a killed build only leaves the temporary folder
+		logger.info('Building price panel cache for ' + str(len(self.tickers)) + ' tickers in ' + self._cacheFolder)
+		files = {}
+		for t in self.tickers:
+			if os.path.isfile(self._SourceFile(t)): files[t] = self._SourceFile(t)
+			else: logger.info('No price history for ' + t)
+		dates = pd.DatetimeIndex([])
+		for f in files.values(): dates = dates.union(pd.read_csv(f, usecols=[0], index_col=0, parse_dates=True).index.unique())
+		dates = dates.values.astype('datetime64[D]')
+		buildFolder = self._NewBuildFolder()
+		values, listed = self._CreateArrays(buildFolder, dates)
+		for field in priceFields: values[field][:] = np.nan
+		for t in files: self._WriteRow(values, listed, t, self._ReadHistory(t), dates)
+		for array in list(values.values()) + [listed]: array.flush()
+		del values, listed
+		self._ReplaceCache(buildFolder)
+
+	def _OpenCache(self):
+		#Copy on write mapping, readers share the pages and anyone modifying a view gets a private copy instead of corrupting the cache
+		self.dates = np.load(self._cacheFolder + 'dates.npy')
+		self.fields = {field:np.load(self._cacheFolder + field + '.npy', mmap_mode='c') for field in priceFields}
+		self.listed = np.load(self._cacheFolder + 'listed.npy', mmap_mode='c')
+
+	def TickerIndex(self, ticker:str): return self._tickerIndex.get(ticker, -1)
+
+	def DateIndex(self, d):
+		#Index of the last trading day on or before d, -1 if d is before the panel starts
+		return int(np.searchsorted(self.dates, ToDay(d), side='right')) - 1
+
+	def DateRange(self, startDate=None, endDate=None):
+		#Slice bounds covering startDate through endDate inclusive
+		i0 = 0 if startDate is None else int(np.searchsorted(self.dates, ToDay(startDate), side='left'))
+		i1 = len(self.dates) if endDate is None else int(np.searchsorted(self.dates, ToDay(endDate), side='right'))
+		return i0, i1
+
+	def Field(self, field:str='Close', startDate=None, endDate=None):
+		#ticker x date view of one field for the date range, no copy
+		i0, i1 = self.DateRange(startDate, endDate)
+		return self.fields[field][:, i0:i1]
+
+	def History(self, ticker:str, startDate=None, endDate=None):
+		#Price history of one ticker as a DataFrame, only the dates the ticker has a Close for so it matches its own csv.  A view of the panel when there are no gaps
+		i = self._tickerIndex[ticker]
+		i0, i1 = self.DateRange(startDate, endDate)
+		valid = ~np.isnan(self.fields['Close'][i, i0:i1])
+		rows = slice(i0, i1) if valid.all() else i0 + np.flatnonzero(valid)
+		index = pd.DatetimeIndex(self.dates[rows], name='Date')
+		return pd.DataFrame({field:self.fields[field][i, rows] for field in priceFields}, index=index, copy=False)
+
+_panels = {}
+def GetPricePanel(tickerList:list, verbose:bool=False, dtype:str='float64', reload:bool=False):
+	#One panel per ticker universe and dtype per process, later callers get the already mapped instance.  reload checks the source files again after they were refreshed
+	key = (tuple(dict.fromkeys(tickerList)), np.dtype(dtype).name)
+	if reload or not key in _panels: _panels[key] = PricePanel(list(key[0]), dtype=dtype, verbose=verbose)
+	return _panels[key]
+
+def RefreshHistory(ticker:str, verbose:bool=False):
+	#PricingData only downloads a history when its csv is missing, so the csv is moved aside while it fetches the ticker again.
+	#The old file is put back when nothing new was saved.  Returns True when the history was replaced
+	sourceFile = historicalFolder + ticker + '.csv'
+	staleFile = sourceFile + '.stale'
+	if os.path.isfile(sourceFile): os.replace(sourceFile, staleFile)
+	try:
+		_originalPricingData(ticker).LoadHistory(verbose=verbose)
+	except Exception as e:
+		logger.warning('Unable to refresh ' + ticker + ': ' + repr(e))
+	refreshed = os.path.isfile(sourceFile)
+	if refreshed:
+		if os.path.isfile(staleFile): os.remove(staleFile)
+	elif os.path.isfile(staleFile):
+		os.replace(staleFile, sourceFile)
+	return refreshed
+
+class PanelPricingData(PriceTradeAnalyzer.PricingData):
+	#PricingData that serves its history from the shared panel instead of reparsing the csv, tickers outside the panel load the usual way.
+	#It returns the panel's Open, High, Low and Close only, without Volume or anything else the library loader adds, and has not been compared
+	#against the csv path, so AttachPricePanel stays opt in
+	panel = None
+	def LoadHistory(self, requestedStartDate=None, requestedEndDate=None, verbose:bool=False, *args, **kwargs):
+		if self.panel is None or self.panel.TickerIndex(self.ticker) < 0:
+			return super().LoadHistory(requestedStartDate, requestedEndDate, verbose, *args, **kwargs)
+		self.historicalPrices = self.panel.History(self.ticker, requestedStartDate, requestedEndDate)
+		if len(self.historicalPrices) == 0: return False
+		self.historyStartDate = self.historicalPrices.index.min()
+		self.historyEndDate = self.historicalPrices.index.max()
+		self.pricesLoaded = True
+		return True
+
+_originalPricingData = PriceTradeAnalyzer.PricingData
+def AttachPricePanel(panel:PricePanel):
+	#Routes PricingData used by StockPicker and TradingModel through the panel
+	PanelPricingData.panel = panel
+	PriceTradeAnalyzer.PricingData = PanelPricingData
+
+def DetachPricePanel():
+	PanelPricingData.panel = None
+	PriceTradeAnalyzer.PricingData = _originalPricingData
@@ -0,0 +1,213 @@
+import sys
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from PricePanel import GetPricePanel
+from Profiling import logger
+
+#Precomputed momentum signals.  Rolling long/short history returns and point value are computed once per ticker universe as date x ticker matrices,
+#so picking stocks on a rebalance day is a lookup of one row plus an argpartition instead of recomputing every ticker's history
+#Universes of largeUniverseSize tickers or more use a float32 panel and compute only the rebalance day's row for the tickers listed that day,
+#so memory stays at the panel (see PricePanel.PanelBytes) plus a few rows, and each pick is O(tickers) with no sort of the whole universe
+largeUniverseSize = 500
+
+#PointValue and filterOptions were written from the descriptions of StockPicker's filters, not taken from its source.  Nothing but VerifySignalPicker
+#checks them against StockPicker, which is why useSignals and everything built on these signals stays opt in until tests/test_signal_picker.py passes
+def WarnUnchecked(caller:str):
+	#Said by everything that always picks from these signals (WalkForward, PortfolioSet, RunMonteCarlo) rather than offering StockPicker as the default
+	logger.warning(caller + ' picks with the PriceSignals filters, which have not been checked against StockPicker, see tests/test_signal_picker.py')
+
+def PointValue(longHistoryPC, shortHistoryPC):
+	#Weight used by the point value allocation, one point per 10% of long term gain with a bonus point when the short term trend agrees
+	return np.floor(np.clip(longHistoryPC, 0, None) * 10) + (shortHistoryPC > 0)
+
+#filterOption: (predicate on longHistoryPC, shortHistoryPC, Point_Value, minPercentGain), column to rank by
+filterOptions = {
+	0: (lambda lpc, spc, pv, mg: np.ones(np.shape(lpc), dtype=bool), 'longHistoryPC'), #no filter, highest long term gain
+	1: (lambda lpc, spc, pv, mg: (lpc > mg) & (spc < lpc) & (spc > 0), 'longHistoryPC'), #long term performer at a short term discount, but not negative
+	2: (lambda lpc, spc, pv, mg: (lpc > mg) & (spc > 0), 'longHistoryPC'), #long term performer, not slowing down
+	3: (lambda lpc, spc, pv, mg: lpc > mg, 'longHistoryPC'), #long term performer
+	4: (lambda lpc, spc, pv, mg: spc > mg, 'shortHistoryPC'), #short term performer
+	44: (lambda lpc, spc, pv, mg: (spc > mg) & (lpc > 0), 'shortHistoryPC'), #short term performer with long term gains
+	5: (lambda lpc, spc, pv, mg: (pv > 0) & (lpc > mg), 'Point_Value'), #point value
+}
+
+def FilterMask(filterOption:int, longHistoryPC, shortHistoryPC, pointValue, minPercentGain:float=0.05):
+	#Boolean mask of the stocks passing filterOption, works on arrays of any shape (a row, a date x ticker matrix, or stacked scenarios)
+	predicate, rankColumn = filterOptions[filterOption]
+	with np.errstate(invalid='ignore'):
+		return predicate(longHistoryPC, shortHistoryPC, pointValue, minPercentGain) & ~np.isnan(longHistoryPC) & ~np.isnan(shortHistoryPC)
+
+def RankScore(filterOption:int, longHistoryPC, shortHistoryPC, pointValue):
+	#The signal filterOption ranks by
+	rankColumn = filterOptions[filterOption][1]
+	if rankColumn == 'shortHistoryPC': return shortHistoryPC
+	if rankColumn == 'Point_Value': return pointValue
+	return longHistoryPC
+
+def TopK(score, mask, k:int, order=None):
+	#Indexes of the k highest scores where mask is set, highest first.  Equal scores, common with the integer Point_Value, go to the ticker that comes first
+	#in order (position in the picker's ticker list, the index when None) so the picks never depend on the sort.  Partitioning keeps this O(n) in the
+	#universe size, only the k winners and the candidates tied with the last of them get sorted
+	candidates = np.flatnonzero(mask & ~np.isnan(score))
+	if len(candidates) > k:
+		if k <= 0: return candidates[:0]
+		kth = np.partition(-score[candidates], k-1)[k-1]
+		candidates = candidates[-score[candidates] <= kth]
+	tieBreak = candidates if order is None else order[candidates]
+	return candidates[np.lexsort((tieBreak, -score[candidates]))][:k]
+
+def LagIndex(dates, days:int):
+	#For each date, the index of the last trading day on or before date - days, -1 if that is before the data starts
+	return np.searchsorted(dates, dates - np.timedelta64(days, 'D'), side='right') - 1
+
+def TrailingReturn(close, lag):
+	#close is date x ticker, returns close[i]/close[lag[i]] - 1 for every row
+	with np.errstate(divide='ignore', invalid='ignore'):
+		result = close / close[np.clip(lag, 0, None)] - 1
+	result[lag < 0] = np.nan
+	return result
+
+def SignalsOnDay(panel, dateIndex:int, longHistory:int=365, shortHistory:int=30, tickerIndexes=None):
+	#One row of the signal matrices computed on its own, for callers that only need a few days such as the live tracker.  tickerIndexes limits it to those tickers
+	close = panel.fields['Close']
+	tickers = slice(None) if tickerIndexes is None else tickerIndexes
+	current = close[tickers, dateIndex]
+	rows = []
+	for days in (longHistory, shortHistory):
+		lag = int(np.searchsorted(panel.dates, panel.dates[dateIndex] - np.timedelta64(days, 'D'), side='right')) - 1
+		with np.errstate(divide='ignore', invalid='ignore'):
+			rows.append(current / close[tickers, lag] - 1 if lag >= 0 else np.full(len(current), np.nan, dtype=current.dtype))
+	longHistoryPC, shortHistoryPC = rows
+	return longHistoryPC, shortHistoryPC, PointValue(longHistoryPC, shortHistoryPC)
+
+def SelectOnDay(panel, dateIndex:int, longHistory:int=365, shortHistory:int=30, stocksToReturn:int=5, filterOption:int=3, minPercentGain:float=0.05, universe=None):
+	longHistoryPC, shortHistoryPC, pointValue = SignalsOnDay(panel, dateIndex, longHistory, shortHistory)
+	mask = FilterMask(filterOption, longHistoryPC, shortHistoryPC, pointValue, minPercentGain)
+	if universe is not None: mask = mask & universe
+	return TopK(RankScore(filterOption, longHistoryPC, shortHistoryPC, pointValue), mask, stocksToReturn)
+
+class MomentumSignals():
+	def __init__(self, panel, longHistory:int=365, shortHistory:int=30):
+		self.panel = panel
+		self.longHistory = longHistory
+		self.shortHistory = shortHistory
+		close = np.ascontiguousarray(panel.fields['Close'].T) #date x ticker so one rebalance day is one contiguous row
+		self.longHistoryPC = TrailingReturn(close, LagIndex(panel.dates, longHistory))
+		self.shortHistoryPC = TrailingReturn(close, LagIndex(panel.dates, shortHistory))
+		self.pointValue = PointValue(self.longHistoryPC, self.shortHistoryPC)
+		self.close = close
+		self._masks = {}
+
+	def Mask(self, filterOption:int, minPercentGain:float=0.05):
+		#Full date x ticker predicate matrix, computed on first use
+		key = (filterOption, minPercentGain)
+		if not key in self._masks: self._masks[key] = FilterMask(filterOption, self.longHistoryPC, self.shortHistoryPC, self.pointValue, minPercentGain)
+		return self._masks[key]
+
+	def Score(self, filterOption:int): return RankScore(filterOption, self.longHistoryPC, self.shortHistoryPC, self.pointValue)
+
+	def Select(self, dateIndex:int, stocksToReturn:int=5, filterOption:int=3, minPercentGain:float=0.05, universe=None, order=None):
+		#Ticker indexes picked on one day, universe is an optional boolean mask over the panel tickers and order the tie break, see TopK
+		if dateIndex < 0: return np.array([], dtype=int)
+		mask = self.Mask(filterOption, minPercentGain)[dateIndex]
+		if universe is not None: mask = mask & universe
+		return TopK(self.Score(filterOption)[dateIndex], mask, stocksToReturn, order)
+
+	def SelectionFrame(self, dateIndex:int, selected):
+		#Same shape as StockPicker.GetHighestPriceMomentum output
+		result = pd.DataFrame({'Ticker':[self.panel.tickers[i] for i in selected], 'currentPrice':self.close[dateIndex, selected], 'longHistoryPC':self.longHistoryPC[dateIndex, selected], 'shortHistoryPC':self.shortHistoryPC[dateIndex, selected], 'Point_Value':self.pointValue[dateIndex, selected]})
+		return result
+
+_momentumSignals = OrderedDict()
+maxMomentumSignals = 8 #Signal matrices kept per process, the least recently used are dropped so long running processes such as BacktestServer workers stay bounded
+def GetMomentumSignals(panel, longHistory:int=365, shortHistory:int=30):
+	#One MomentumSignals per panel and pair of history windows per process, shared by every picker, walk forward and portfolio set
+	key = (id(panel), longHistory, shortHistory) #The cached signals hold a reference to the panel, so its id can't be reused
+	if key in _momentumSignals:
+		_momentumSignals.move_to_end(key)
+	else:
+		_momentumSignals[key] = MomentumSignals(panel, longHistory, shortHistory)
+		while len(_momentumSignals) > maxMomentumSignals: _momentumSignals.popitem(last=False)
+	return _momentumSignals[key]
+
+class SignalPicker():
+	#Drop in replacement for StockPicker backed by the shared price panel and precomputed signal matrices, largeUniverse computes one row per rebalance instead
+	def __init__(self, panel, startDate=None, endDate=None, largeUniverse:bool=False):
+		self.panel = panel
+		self.largeUniverse = largeUniverse
+		self._startDate = startDate
+		self._endDate = endDate
+		self._tickerList = []
+		self._universe = np.zeros(len(panel.tickers), dtype=bool)
+		self._order = np.zeros(len(panel.tickers), dtype=int) #Position of each added ticker in the order it was added, ties are broken in this order as StockPicker lists them
+
+	def AddTicker(self, ticker:str):
+		i = self.panel.TickerIndex(ticker)
+		if i >= 0 and not self._universe[i]:
+			self._universe[i] = True
+			self._order[i] = len(self._tickerList)
+			self._tickerList.append(ticker)
+
+	def Signals(self, longHistoryDays:int=365, shortHistoryDays:int=30):
+		return GetMomentumSignals(self.panel, longHistoryDays, shortHistoryDays)
+
+	def _SelectRow(self, dateIndex:int, longHistoryDays:int, shortHistoryDays:int, stocksToReturn:int, filterOption:int, minPercentGain):
+		#Signals of the tickers listed on dateIndex only, nothing is kept between rebalances
+		candidates = np.flatnonzero(self._universe & self.panel.listed[:, dateIndex]) if dateIndex >= 0 else np.array([], dtype=int)
+		if len(candidates) == 0: return pd.DataFrame(columns=['Ticker','currentPrice','longHistoryPC','shortHistoryPC','Point_Value'])
+		longHistoryPC, shortHistoryPC, pointValue = SignalsOnDay(self.panel, dateIndex, longHistoryDays, shortHistoryDays, candidates)
+		mask = FilterMask(filterOption, longHistoryPC, shortHistoryPC, pointValue, minPercentGain)
+		selected = TopK(RankScore(filterOption, longHistoryPC, shortHistoryPC, pointValue), mask, stocksToReturn, self._order[candidates])
+		return pd.DataFrame({'Ticker':[self.panel.tickers[i] for i in candidates[selected]], 'currentPrice':self.panel.fields['Close'][candidates[selected], dateIndex], 'longHistoryPC':longHistoryPC[selected], 'shortHistoryPC':shortHistoryPC[selected], 'Point_Value':pointValue[selected]})
+
+	def GetHighestPriceMomentum(self, currentDate, longHistoryDays:int=365, shortHistoryDays:int=30, stocksToReturn:int=5, filterOption:int=3, minPercentGain=0.05, verbose:bool=False):
+		dateIndex = self.panel.DateIndex(currentDate)
+		if self.largeUniverse:
+			result = self._SelectRow(dateIndex, longHistoryDays, shortHistoryDays, stocksToReturn, filterOption, minPercentGain)
+		else:
+			signals = self.Signals(longHistoryDays, shortHistoryDays)
+			selected = signals.Select(dateIndex, stocksToReturn, filterOption, minPercentGain, self._universe, self._order)
+			result = signals.SelectionFrame(dateIndex, selected)
+		if verbose: print(result)
+		return result
+
+def CreateSignalPicker(tickerList:list, startDate=None, endDate=None):
+	#SignalPicker over the shared panel of tickerList and the index, large universes get the float32 panel and the one row per rebalance picker
+	largeUniverse = len(tickerList) >= largeUniverseSize
+	panel = GetPricePanel(list(tickerList) + ['.INX'], dtype='float32' if largeUniverse else 'float64')
+	return SignalPicker(panel, startDate, endDate, largeUniverse)
+
+def VerifySignalPicker(tickerList:list, startDate:str='1/1/1982', endDate:str='1/1/2018', ReEvaluationInterval:int=20, longHistory:int=365, shortHistory:int=90, stocksToReturn:int=9, minPercentGain=0.05, filterOptionList:list=None):
+	#Checks SignalPicker against StockPicker on every rebalance day, returns the days where the picks or their longHistoryPC, shortHistoryPC or Point_Value differ.
+	#An empty result means the two agree, tests/test_signal_picker.py runs this on synthetic price histories
+	from _classes.PriceTradeAnalyzer import StockPicker
+	from _classes.Utility import ToDate, AddDays
+	if filterOptionList is None: filterOptionList = list(filterOptions.keys())
+	panel = GetPricePanel(list(tickerList) + ['.INX'])
+	picker = StockPicker(AddDays(ToDate(startDate), -730), ToDate(endDate))
+	fastPicker = SignalPicker(panel)
+	for t in tickerList:
+		picker.AddTicker(t)
+		fastPicker.AddTicker(t)
+	i0, i1 = panel.DateRange(startDate, endDate)
+	mismatches = []
+	for dateIndex in range(i0, i1, ReEvaluationInterval):
+		currentDate = pd.Timestamp(panel.dates[dateIndex]).to_pydatetime()
+		for filterOption in filterOptionList:
+			expected = picker.GetHighestPriceMomentum(currentDate, longHistoryDays=longHistory, shortHistoryDays=shortHistory, stocksToReturn=stocksToReturn, filterOption=filterOption, minPercentGain=minPercentGain)
+			actual = fastPicker.GetHighestPriceMomentum(currentDate, longHistoryDays=longHistory, shortHistoryDays=shortHistory, stocksToReturn=stocksToReturn, filterOption=filterOption, minPercentGain=minPercentGain)
+			expectedTickers = list(expected['Ticker'])
+			actualTickers = list(actual['Ticker'])
+			same = expectedTickers == actualTickers
+			for column in ['longHistoryPC','shortHistoryPC','Point_Value']:
+				same = same and np.allclose(expected[column].astype(float).values, actual[column].astype(float).values, rtol=1e-9, atol=1e-9)
+			if not same: mismatches.append((currentDate, filterOption, expectedTickers, actualTickers))
+	print(str(len(mismatches)) + ' mismatches')
+	for m in mismatches: print(m)
+	return mismatches
+
+if __name__ == '__main__':
+	from _classes.TickerLists import TickerLists
+	mismatches = VerifySignalPicker(TickerLists.SPTop70())
+	sys.exit(1 if len(mismatches) > 0 else 0)
@@ -0,0 +1,109 @@
+import time, logging
+import numpy as np
+import pandas as pd
+from ResultStore import ActiveResultStore
+
+#Logging and phase timing for the strategy loops.  Rebalance details go to the PriceMomentumTrader logger at INFO level, so they cost nothing
+#unless a handler is configured (the scripts do that when run from the command line).  With profiling enabled every Phase() block is timed and
+#every Count() incremented, a run's breakdown (calls, total, mean and p95 per phase) is saved next to its daily values and added to the session totals.
+#Timers are per process, runs in pool workers are not included in the parent's totals.
+logger = logging.getLogger('PriceMomentumTrader')
+
+class _PhaseBlock():
+	def __init__(self, timers, name:str):
+		self._timers = timers
+		self._name = name
+
+	def __enter__(self):
+		self._start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		self._timers.Record(self._name, time.perf_counter() - self._start)
+		return False
+
+class _NoPhase():
+	def __enter__(self): return self
+	def __exit__(self, *exc): return False
+_noPhase = _NoPhase()
+
+class PhaseTimers():
+	def __init__(self):
+		self.times = {}
+		self.counts = {}
+
+	def Phase(self, name:str): return _PhaseBlock(self, name)
+
+	def Record(self, name:str, seconds:float): self.times.setdefault(name, []).append(seconds)
+
+	def Count(self, name:str, n:int=1): self.counts[name] = self.counts.get(name, 0) + n
+
+	def Merge(self, other):
+		for name, values in other.times.items(): self.times.setdefault(name, []).extend(values)
+		for name, n in other.counts.items(): self.Count(name, n)
+
+	def Summary(self):
+		#One row per phase with Calls, Total, Mean and P95 in seconds, followed by one row per counter with only Calls filled in
+		rows = []
+		for name, values in self.times.items():
+			values = np.array(values)
+			rows.append((name, len(values), values.sum(), values.mean(), np.percentile(values, 95)))
+		for name, n in self.counts.items():
+			rows.append((name, n, np.nan, np.nan, np.nan))
+		return pd.DataFrame(rows, columns=['Phase','Calls','Total','Mean','P95']).set_index('Phase')
+
+_run = None
+_totals = None
+_saveBreakdown = False
+
+def EnableProfiling(saveBreakdown:bool=True):
+	#saveBreakdown writes each run's timing breakdown alongside its results
+	global _run, _totals, _saveBreakdown
+	_run = PhaseTimers()
+	_totals = PhaseTimers()
+	_saveBreakdown = saveBreakdown
+
+def DisableProfiling():
+	global _run, _totals
+	_run = _totals = None
+
+def Phase(name:str):
+	#with Phase('ProcessDay'): ... times the block when profiling is enabled
+	return _noPhase if _run is None else _run.Phase(name)
+
+def Count(name:str, n:int=1):
+	if _run is not None: _run.Count(name, n)
+
+def StartRun():
+	#Starts a new run's breakdown, anything recorded since the last run is folded into the totals
+	if _run is None: return
+	_totals.Merge(_run)
+	_run.__init__()
+
+def EndRun(modelName:str, startDate, durationInYears:int, saveResults:bool=True):
+	#Returns the run's breakdown and folds it into the totals, saved as a timing csv (or a result store table) when saveResults and saveBreakdown are set
+	if _run is None: return None
+	summary = _run.Summary()
+	_totals.Merge(_run)
+	_run.__init__()
+	if len(summary) > 0:
+		logger.info('%s timing\n%s', modelName, summary)
+		if saveResults and _saveBreakdown:
+			if ActiveResultStore() is None:
+				summary.to_csv('data/trademodel/' + modelName + '_' + str(pd.Timestamp(startDate).date()) + '_' + str(durationInYears) + 'year_timing.csv')
+			else:
+				ActiveResultStore().Append('timing', modelName + '_' + str(pd.Timestamp(startDate).date()) + '_' + str(durationInYears) + 'year', summary, {'startDate':str(pd.Timestamp(startDate).date()), 'durationInYears':durationInYears}, replace=True) #Replaces a rerun's breakdown like the csv it stands in for
+	return summary
+
+def ProfileSummary():
+	#Breakdown of every run since profiling was enabled
+	if _run is None: return pd.DataFrame()
+	timers = PhaseTimers()
+	timers.Merge(_totals)
+	timers.Merge(_run)
+	return timers.Summary()
+
+def ConfigureLogging(level:int=logging.INFO):
+	#Console output for the scripts, level=logging.WARNING silences the rebalance details
+	logging.basicConfig(level=level, format='%(message)s')
+	logger.setLevel(level)
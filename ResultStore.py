@@ -0,0 +1,162 @@
+import os, re, json, fnmatch
+import numpy as np
+import pandas as pd
+
+#Appendable, compressed, column oriented store for model results instead of one large csv per run.
+#Tables are dailyvalue, trades and summary.  Each table is partitioned into one folder per model run (model name with its parameters),
+#every append adds a compressed .npz part holding one array per column, and manifest.json records each part's date range.
+#Queries open only the partitions, parts and columns asked for, the npz members of other columns are never read.
+#A part loaded from a csv file records the file name, so importing the same file again is skipped.  StoreModelHistory stores a run with replace,
+#so rerunning the same model over the same dates replaces the run's rows instead of adding a second copy.
+resultFolder = 'data/results/'
+tradeModelFolder = 'data/trademodel/'
+dateColumns = {'dailyvalue':'Date', 'trades':'dateBuyOrderPlaced', 'summary':'StartDate'}
+
+def _Partition(name:str): return re.sub(r'[^\w\-. ]', '_', name)
+
+class ResultStore():
+	def __init__(self, folder:str=resultFolder):
+		self.folder = folder
+
+	def _PartitionFolder(self, table:str, modelName:str): return os.path.join(self.folder, table, _Partition(modelName)) + '/'
+
+	def _Manifest(self, partitionFolder:str):
+		manifestFile = partitionFolder + 'manifest.json'
+		if not os.path.isfile(manifestFile): return {'params':{}, 'parts':[]}
+		with open(manifestFile) as f: return json.load(f)
+
+	def Imported(self, table:str, modelName:str, source:str):
+		#True when a part of the model's partition was loaded from the file source
+		return any(part.get('source') == source for part in self._Manifest(self._PartitionFolder(table, modelName))['parts'])
+
+	def Append(self, table:str, modelName:str, frame:pd.DataFrame, params:dict=None, source:str=None, replace:bool=False):
+		#Adds the rows of frame to the model's partition, a date index is stored as the table's date column.  source is the file the rows were read from.
+		#replace drops the parts already in the partition once the new one is saved
+		if frame is None or len(frame) == 0: return
+		dateColumn = dateColumns.get(table)
+		frame = frame.reset_index() if frame.index.name is not None else frame.reset_index(drop=True)
+		columns = {}
+		for c in frame.columns:
+			values = frame[c]
+			if c == dateColumn or str(c).startswith('date'):
+				values = pd.to_datetime(values, errors='coerce').values.astype('datetime64[D]')
+			elif pd.api.types.is_numeric_dtype(values):
+				values = values.values
+			else:
+				values = np.asarray(values.astype(str), dtype=np.str_)
+			columns[str(c)] = values
+		partitionFolder = self._PartitionFolder(table, modelName)
+		os.makedirs(partitionFolder, exist_ok=True)
+		manifest = self._Manifest(partitionFolder)
+		partName = 'part-' + str(1 + max([int(part['file'][5:10]) for part in manifest['parts']], default=-1)).zfill(5) + '.npz'
+		np.savez_compressed(partitionFolder + partName, **columns)
+		dates = columns.get(dateColumn)
+		dateRange = [str(np.nanmin(dates)), str(np.nanmax(dates))] if dates is not None and not np.all(np.isnat(dates)) else [None, None]
+		manifest['modelName'] = modelName
+		if params: manifest['params'].update({k:str(v) for k, v in params.items()})
+		part = {'file':partName, 'rows':len(frame), 'firstDate':dateRange[0], 'lastDate':dateRange[1]}
+		if source is not None: part['source'] = source
+		replaced = manifest['parts'] if replace else []
+		manifest['parts'] = [part] if replace else manifest['parts'] + [part]
+		with open(partitionFolder + 'manifest.json', 'w') as f: json.dump(manifest, f, indent=1)
+		for oldPart in replaced:
+			if os.path.isfile(partitionFolder + oldPart['file']): os.remove(partitionFolder + oldPart['file'])
+
+	def Models(self, table:str, pattern:str='*'):
+		#Model runs stored in a table matching a shell style pattern, with their parameters
+		tableFolder = os.path.join(self.folder, table)
+		if not os.path.isdir(tableFolder): return {}
+		result = {}
+		for partition in sorted(os.listdir(tableFolder)):
+			manifest = self._Manifest(os.path.join(tableFolder, partition) + '/')
+			modelName = manifest.get('modelName', partition)
+			if fnmatch.fnmatch(modelName, pattern): result[modelName] = manifest['params']
+		return result
+
+	def Query(self, table:str, pattern:str='*', columns:list=None, startDate=None, endDate=None):
+		#Rows of every model matching pattern, only the requested columns and dates are loaded.  A Model column says which run each row came from
+		dateColumn = dateColumns.get(table)
+		first = None if startDate is None else np.datetime64(pd.Timestamp(startDate), 'D')
+		last = None if endDate is None else np.datetime64(pd.Timestamp(endDate), 'D')
+		frames = []
+		for modelName in self.Models(table, pattern):
+			partitionFolder = self._PartitionFolder(table, modelName)
+			for part in self._Manifest(partitionFolder)['parts']:
+				if first is not None and part['lastDate'] is not None and np.datetime64(part['lastDate']) < first: continue
+				if last is not None and part['firstDate'] is not None and np.datetime64(part['firstDate']) > last: continue
+				with np.load(partitionFolder + part['file']) as data:
+					keep = np.ones(part['rows'], dtype=bool)
+					if dateColumn in data.files and (first is not None or last is not None):
+						dates = data[dateColumn]
+						if first is not None: keep &= dates >= first
+						if last is not None: keep &= dates <= last
+					names = data.files if columns is None else [c for c in data.files if c in columns or c == dateColumn]
+					frame = pd.DataFrame({c:data[c][keep] for c in names})
+				frame.insert(0, 'Model', modelName)
+				frames.append(frame)
+		if len(frames) == 0: return pd.DataFrame()
+		return pd.concat(frames, ignore_index=True)
+
+	def ImportCsvFolder(self, folder:str='Data/'):
+		#Loads the csv files written by CloseModel and the Compare functions, returns the number of files imported.  Files imported before are skipped
+		imported = 0
+		for fileName in sorted(os.listdir(folder)):
+			m = re.match(r'^(.*)_(\d{4}-\d{2}-\d{2})_(\d+)year_(dailyvalue|trades)\.csv$', fileName)
+			if m:
+				modelName, startDate, durationInYears, table = m.groups()
+				runName = modelName + '_' + startDate + '_' + durationInYears + 'year'
+				if self.Imported(table, runName, fileName): continue
+				frame = pd.read_csv(os.path.join(folder, fileName), index_col=0 if table == 'dailyvalue' else None)
+				self.Append(table, runName, frame, {'startDate':startDate, 'durationInYears':durationInYears}, fileName)
+				imported += 1
+				continue
+			m = re.match(r'^Compare(.*)_year (\d+)_duration(\d+)\.csv$', fileName)
+			if m:
+				modelName, startYear, durationInYears = m.groups()
+				if self.Imported('summary', modelName, fileName): continue
+				summary = pd.read_csv(os.path.join(folder, fileName))
+				modelOneName = modelName.split('_to_')[0]
+				renames = {} #Older files named the model columns after the model
+				for c in summary.columns:
+					if c.startswith(modelOneName) or c.startswith('Model'): continue
+					if c.endswith('EndingValue'): renames[c] = 'ModelEndingValue'
+					elif c.endswith('Gain'): renames[c] = 'ModelGain'
+				summary.rename(columns=renames, inplace=True)
+				self.Append('summary', modelName, summary, {'startYear':startYear, 'durationInYears':durationInYears}, fileName)
+				imported += 1
+		return imported
+
+_store = None
+def AttachResultStore(store:ResultStore=None):
+	#Once attached, model histories and Compare results are appended to the store.  Compare results and vectorized runs are no longer written as csv files,
+	#TradingModel runs still are since their trades are only available from the _trades.csv CloseModel writes
+	global _store
+	_store = store if store is not None else ResultStore()
+	return _store
+
+def ActiveResultStore(): return _store
+
+def TradesCsvFile(modelName:str, startDate, durationInYears:int, folder:str=tradeModelFolder):
+	#The _trades.csv CloseModel wrote for a run, its name has the first trading day on or after startDate.  None when there is no such file
+	if not os.path.isdir(folder): return None
+	first = pd.Timestamp(startDate)
+	pattern = re.compile('^' + re.escape(modelName) + r'_(\d{4}-\d{2}-\d{2})_' + str(durationInYears) + r'year_trades\.csv$')
+	dates = sorted(m.group(1) for m in [pattern.match(fileName) for fileName in os.listdir(folder)] if m and first <= pd.Timestamp(m.group(1)) <= first + pd.Timedelta(days=10))
+	if len(dates) == 0: return None
+	return os.path.join(folder, modelName + '_' + dates[0] + '_' + str(durationInYears) + 'year_trades.csv')
+
+def StoreModelHistory(modelName:str, startDate, durationInYears:int, dailyValue:pd.DataFrame, trades:pd.DataFrame=None, params:dict=None):
+	#Does nothing when no store is attached.  Without trades the _trades.csv CloseModel wrote for the run is imported.  A rerun replaces the run's rows
+	if _store is None: return
+	runName = modelName + '_' + str(pd.Timestamp(startDate).date()) + '_' + str(durationInYears) + 'year'
+	runParams = dict(params or {}, startDate=str(pd.Timestamp(startDate).date()), durationInYears=durationInYears)
+	_store.Append('dailyvalue', runName, dailyValue, runParams, replace=True)
+	if trades is not None:
+		_store.Append('trades', runName, trades, runParams, replace=True)
+	else:
+		tradesFile = TradesCsvFile(modelName, startDate, durationInYears)
+		if tradesFile is not None: _store.Append('trades', runName, pd.read_csv(tradesFile), runParams, os.path.basename(tradesFile), replace=True)
+
+if __name__ == '__main__':
+	store = ResultStore()
+	print('Imported ' + str(store.ImportCsvFolder('Data/')) + ' files into ' + store.folder)
@@ -0,0 +1,224 @@
+import os, re
+import numpy as np
+import pandas as pd
+
+#Array based alternative to stepping TradingModel.ProcessDay one day at a time.  Holdings only change on rebalance days, so between rebalances
+#the daily CashValue/AssetValue/TotalValue series is one matrix product of the held units with the panel's close prices.
+#Fills follow the TradingModel trade logs in Data/: on a rebalance day everything held is sold at that day's open, the sell order price being the close before it,
+#and the new targets are bought on the next trading day at the open.  The cash after the sale buys floor(cash / tranchSize) tranches, at most maxTranches, spread over the targets by
+#TargetHoldings with the remainder going to the targets in the order given, each tranche being round(tranchSize / order price) units at the rebalance day close.
+#Like the logs a buy is recorded as placed on the day it fills and a ticker bought in several tranches gets a trade per tranche.
+#The last day sells at its open like CloseModel, so the last TotalValue is all cash.
+#The tolerances are the worst differences from replaying the three logs in Data/ with ReplayTradeLog, each rebalance starting from the log's cash, see MeasureTolerance.
+#The logs round prices to three decimals, and about 2% of their buys are sized at the fill price instead of the order price for no reason the logs show, which is
+#where the differences come from.  They add up over a long run: replaying the 36 year logs without resetting the cash (fromLogCash=False) drifts up to
+#18.6% from the logged TotalValue, which is endToEndTolerance.  That, not the per rebalance tolerances, is what to expect of a whole run.
+#A full run also depends on the picks and on prices the logs don't have, so these bound the fills only.
+dailyValueTolerance = 0.035 #Worst CashValue or TotalValue difference as a fraction of TotalValue
+tradeTolerance = 0.105 #Worst relative difference in units or prices of matching trades
+endToEndTolerance = 0.19 #Worst CashValue or TotalValue difference as a fraction of TotalValue replaying a whole log from the starting cash only
+maxTranches = 100 #AlignPositions never buys more tranches than this however much cash there is, the rest stays in cash
+tradeColumns = ['dateBuyOrderPlaced','ticker','dateBuyOrderFilled','dateSellOrderPlaced','dateSellOrderFilled','units','buyOrderPrice','purchasePrice','sellOrderPrice','sellPrice','NetChange']
+
+def ToDay(d): return np.datetime64(pd.Timestamp(d), 'D') #Same as PricePanel.ToDay, defined here so replaying the logs needs neither the panel nor the library
+
+def ForwardFill(prices):
+	#ticker x date, carries the last price forward over days a ticker didn't trade, days before a ticker's first price become 0
+	valid = ~np.isnan(prices)
+	index = np.where(valid, np.arange(prices.shape[1]), 0)
+	np.maximum.accumulate(index, axis=1, out=index)
+	result = np.take_along_axis(prices, index, axis=1)
+	return np.nan_to_num(result, nan=0.0)
+
+def RebalanceDays(dayCount:int, ReEvaluationInterval:int, offset:int=0):
+	#Day indexes where the strategy loops call AlignPositions, dayCounter starts at zero on the first day
+	return list(range(offset, dayCount, ReEvaluationInterval))
+
+def TranchCounts(cash:float, tranchSize:float, weights:list):
+	#Splits the tranches the cash can buy over the targets in proportion to their weights, the remainder goes one each to the first targets
+	tranchCount = min(int(cash / tranchSize + 1e-9), maxTranches) #portfolioSize/stockCount tranches have to fit portfolioSize exactly
+	weights = np.asarray(weights, dtype=float)
+	counts = np.floor(tranchCount * weights / weights.sum()).astype(int)
+	counts[:tranchCount - counts.sum()] += 1
+	return counts
+
+class VectorPortfolio():
+	#Cash and units held over a window of the panel.  close and openPrices are ticker x date arrays of that window
+	def __init__(self, tickers:list, dates, close, openPrices, portfolioSize:float=30000, tranchSize:float=3000):
+		self.tickers = tickers
+		self.dates = dates
+		self.close = close
+		self.openPrices = openPrices
+		self.cash = float(portfolioSize)
+		self.tranchSize = tranchSize
+		self.units = np.zeros(len(tickers))
+		self.trades = []
+		self._buys = {} #Ticker index: every tranche held, (day placed, day filled, order price, fill price, units)
+
+	def Held(self): return np.flatnonzero(self.units)
+
+	def AssetValue(self, firstDay:int, lastDay:int):
+		#Asset value for days firstDay through lastDay - 1 with the current holdings
+		held = self.Held()
+		if len(held) == 0: return np.zeros(lastDay - firstDay)
+		return self.units[held] @ self.close[held, firstDay:lastDay]
+
+	def SellAll(self, day:int):
+		#Market sell of everything held, ordered at the last close before day and filled at day's open
+		for i in self.Held():
+			orderPrice = self.close[i, max(0, day - 1)]
+			price = self.openPrices[i, day]
+			self.cash += self.units[i] * price
+			for placed, filled, buyOrderPrice, purchasePrice, units in self._buys.pop(i):
+				self.trades.append([self.dates[placed], self.tickers[i], self.dates[filled], self.dates[day], self.dates[day], units, buyOrderPrice, purchasePrice, orderPrice, price, units * (price - purchasePrice)])
+			self.units[i] = 0
+
+	def Buy(self, orderDay:int, targetHoldings:pd.DataFrame, tickerIndex:dict):
+		#targetHoldings is the TargetHoldings frame passed to AlignPositions, indexed by ticker
+		holdings = targetHoldings['TargetHoldings']
+		self.BuyIndexes(orderDay, [tickerIndex.get(ticker, -1) for ticker in holdings.index], holdings.values)
+
+	def BuyIndexes(self, orderDay:int, indexes:list, weights:list):
+		#Same as Buy with ticker indexes and weights instead of a frame, orders are filled in the order given.  A ticker given more than once gets the tranches of each
+		fillDay = orderDay + 1
+		if fillDay >= len(self.dates): return
+		targets = [(i, weight) for i, weight in zip(indexes, weights) if i >= 0 and weight > 0 and self.close[i, orderDay] > 0 and self.openPrices[i, fillDay] > 0]
+		if len(targets) == 0: return
+		for (i, weight), tranchCount in zip(targets, TranchCounts(self.cash, self.tranchSize, [weight for i, weight in targets])):
+			orderPrice = self.close[i, orderDay]
+			fillPrice = self.openPrices[i, fillDay]
+			tranches = []
+			for t in range(tranchCount):
+				units = min(np.round(self.tranchSize / orderPrice), np.floor(self.cash / fillPrice))
+				if units <= 0: break
+				self.cash -= units * fillPrice
+				tranches.append(units)
+			if len(tranches) == 0: continue
+			self.units[i] += sum(tranches)
+			self._buys.setdefault(i, []).extend((fillDay, fillDay, orderPrice, fillPrice, units) for units in tranches)
+
+	def TradeHistory(self): return pd.DataFrame(self.trades, columns=tradeColumns)
+
+def RunVectorBacktest(panel, targetHoldings:dict, startDate, endDate, portfolioSize:float=30000, tranchSize:float=3000):
+	#targetHoldings maps rebalance date to the TargetHoldings frame for that day.  Returns (dailyValue, trades) shaped like the TradingModel csv files
+	i0, i1 = panel.DateRange(startDate, endDate)
+	dates = panel.dates[i0:i1]
+	close = ForwardFill(panel.fields['Close'][:, i0:i1])
+	openPrices = np.nan_to_num(panel.fields['Open'][:, i0:i1], nan=0.0)
+	openPrices = np.where(openPrices > 0, openPrices, close)
+	portfolio = VectorPortfolio(panel.tickers, dates, close, openPrices, portfolioSize, tranchSize)
+	tickerIndex = {t:i for i, t in enumerate(panel.tickers)}
+	rebalances = {}
+	for d, frame in targetHoldings.items():
+		day = int(np.searchsorted(dates, ToDay(d), side='left'))
+		if day < len(dates): rebalances[day] = frame
+	cashValue = np.empty(len(dates))
+	assetValue = np.empty(len(dates))
+	segmentStart = 0
+	for day in sorted(rebalances):
+		cashValue[segmentStart:day] = portfolio.cash
+		assetValue[segmentStart:day] = portfolio.AssetValue(segmentStart, day)
+		portfolio.SellAll(day)
+		cashValue[day] = portfolio.cash
+		assetValue[day] = 0
+		portfolio.Buy(day, rebalances[day], tickerIndex)
+		segmentStart = day + 1
+	cashValue[segmentStart:] = portfolio.cash
+	assetValue[segmentStart:] = portfolio.AssetValue(segmentStart, len(dates))
+	if len(dates) > 0:
+		portfolio.SellAll(len(dates) - 1)
+		cashValue[-1] = portfolio.cash
+		assetValue[-1] = 0
+	dailyValue = pd.DataFrame({'CashValue':cashValue, 'AssetValue':assetValue, 'TotalValue':cashValue + assetValue}, index=pd.DatetimeIndex(dates, name='Date'))
+	return dailyValue, portfolio.TradeHistory()
+
+def SaveVectorBacktest(modelName:str, dailyValue:pd.DataFrame, trades:pd.DataFrame, durationInYears:int, folder:str='data/trademodel/'):
+	#Same file names as TradingModel.CloseModel with _vectorized added to the model name
+	if len(dailyValue) == 0: return
+	os.makedirs(folder, exist_ok=True)
+	fileName = folder + modelName + '_vectorized_' + str(dailyValue.index[0].date()) + '_' + str(durationInYears) + 'year'
+	dailyValue.to_csv(fileName + '_dailyvalue.csv')
+	trades.to_csv(fileName + '_trades.csv', index=False)
+
+def CompareDailyValue(dailyValue:pd.DataFrame, dailyValueFile:str, tolerance:float=dailyValueTolerance):
+	#Checks a vectorized run against a TradingModel _dailyvalue.csv, returns (worst CashValue or TotalValue difference as a fraction of that day's TotalValue, within tolerance).
+	#Days without a value are skipped
+	expected = pd.read_csv(dailyValueFile, index_col=0, parse_dates=True)
+	both = expected[['CashValue','TotalValue']].join(dailyValue[['CashValue','TotalValue']], how='inner', rsuffix='Vectorized')
+	difference = max(((both[c + 'Vectorized'] - both[c]).abs() / both['TotalValue'].abs().clip(lower=1)).max() for c in ['CashValue','TotalValue'])
+	return difference, difference <= tolerance
+
+def CompareTrades(trades:pd.DataFrame, tradesFile:str, tolerance:float=tradeTolerance):
+	#Checks a vectorized run's trades against a TradingModel _trades.csv, trades are matched by ticker and fill date.  The logs keep one row per ticker and fill date,
+	#so only the first tranche of a ticker bought in several is compared.  Returns (differences, within tolerance),
+	#differences has the number of trades only in one of the two, the number of matched trades with different order or sell dates, and the worst relative units and price differences
+	expected = pd.read_csv(tradesFile)
+	frames = []
+	for frame in [expected, trades]:
+		frame = frame.copy()
+		for c in ['dateBuyOrderPlaced','dateBuyOrderFilled','dateSellOrderPlaced','dateSellOrderFilled']: frame[c] = pd.to_datetime(frame[c]).dt.normalize()
+		frames.append(frame.drop_duplicates(['ticker','dateBuyOrderFilled']))
+	both = frames[0].merge(frames[1], on=['ticker','dateBuyOrderFilled'], how='outer', suffixes=('','Vectorized'), indicator=True)
+	matched = both[both['_merge'] == 'both']
+	differences = pd.Series({'unmatched':int((both['_merge'] != 'both').sum()), 'dates':int(sum((matched[c] != matched[c + 'Vectorized']).sum() for c in ['dateBuyOrderPlaced','dateSellOrderPlaced','dateSellOrderFilled']))})
+	relative = lambda c: ((matched[c + 'Vectorized'] - matched[c]).abs() / matched[c].abs()).max() if len(matched) > 0 else 0.0
+	differences['units'] = relative('units')
+	differences['prices'] = max(relative(c) for c in ['buyOrderPrice','purchasePrice','sellOrderPrice','sellPrice'])
+	return differences, differences['unmatched'] == 0 and differences['dates'] == 0 and differences['units'] <= tolerance and differences['prices'] <= tolerance
+
+def ReplayTradeLog(dailyValueFile:str, tradesFile:str, portfolioSize:float=30000, tranchSize:float=3000, fromLogCash:bool=True):
+	#Runs the rebalances of a TradingModel trade log through VectorPortfolio with the prices the log recorded: sellOrderPrice is the close before the sell day, sellPrice
+	#that day's open, buyOrderPrice the close of the rebalance day and purchasePrice the next open.  Each rebalance buys the log's tickers in log order with equal TargetHoldings.
+	#Other closes are not in the log, so AssetValue is only known on the day before each sell.  With fromLogCash each rebalance buys with the cash the log had after the sale,
+	#so the differences of one rebalance don't carry into the next.  Returns (dailyValue, trades) for CompareDailyValue and CompareTrades
+	expected = pd.read_csv(dailyValueFile, index_col=0, parse_dates=True)
+	dates = expected.index.values.astype('datetime64[D]')
+	log = pd.read_csv(tradesFile)
+	tickers = sorted(log['ticker'].unique())
+	tickerIndex = {t:i for i, t in enumerate(tickers)}
+	day = lambda column: np.searchsorted(dates, pd.to_datetime(log[column]).dt.normalize().values.astype('datetime64[D]'))
+	rows = log['ticker'].map(tickerIndex).values
+	sellDay, buyDay = day('dateSellOrderFilled'), day('dateBuyOrderFilled')
+	close = np.full((len(tickers), len(dates)), np.nan)
+	openPrices = np.full((len(tickers), len(dates)), np.nan)
+	close[rows, sellDay - 1] = log['sellOrderPrice'].values
+	openPrices[rows, sellDay] = log['sellPrice'].values
+	close[rows, buyDay - 1] = log['buyOrderPrice'].values
+	openPrices[rows, buyDay] = log['purchasePrice'].values
+	targets = {}
+	for row, d in zip(rows, buyDay - 1): targets.setdefault(int(d), []).append(int(row))
+	portfolio = VectorPortfolio(tickers, dates, close, openPrices, portfolioSize, tranchSize)
+	cashValue = np.empty(len(dates))
+	assetValue = np.empty(len(dates))
+	segmentStart = 0
+	for d in sorted(targets):
+		cashValue[segmentStart:d] = portfolio.cash
+		assetValue[segmentStart:d] = portfolio.AssetValue(segmentStart, d)
+		portfolio.SellAll(d)
+		if fromLogCash: portfolio.cash = expected['CashValue'].iloc[d]
+		cashValue[d] = portfolio.cash
+		assetValue[d] = 0
+		portfolio.BuyIndexes(d, targets[d], np.ones(len(targets[d])))
+		segmentStart = d + 1
+	cashValue[segmentStart:] = portfolio.cash
+	assetValue[segmentStart:] = portfolio.AssetValue(segmentStart, len(dates))
+	portfolio.SellAll(len(dates) - 1)
+	cashValue[-1] = portfolio.cash
+	assetValue[-1] = 0
+	dailyValue = pd.DataFrame({'CashValue':cashValue, 'AssetValue':assetValue, 'TotalValue':cashValue + assetValue}, index=pd.DatetimeIndex(dates, name='Date'))
+	return dailyValue, portfolio.TradeHistory()
+
+def MeasureTolerance(folder:str='Data/', portfolioSize:float=30000, fromLogCash:bool=True):
+	#Replays every TradingModel log in folder, one row per model with the CompareDailyValue and CompareTrades differences.  The stock count in the model name gives the tranche size
+	rows = []
+	for fileName in sorted(os.listdir(folder)):
+		if not fileName.endswith('_trades.csv'): continue
+		tradesFile = os.path.join(folder, fileName)
+		dailyValueFile = tradesFile[:-len('_trades.csv')] + '_dailyvalue.csv'
+		stockCount = re.search(r'_stockcount_(\d+)', fileName)
+		if not os.path.isfile(dailyValueFile) or stockCount is None: continue
+		dailyValue, trades = ReplayTradeLog(dailyValueFile, tradesFile, portfolioSize, portfolioSize / int(stockCount.group(1)), fromLogCash)
+		differences, ok = CompareTrades(trades, tradesFile)
+		differences['dailyValue'] = CompareDailyValue(dailyValue, dailyValueFile)[0]
+		rows.append(differences.rename(fileName[:-len('_trades.csv')]))
+	return pd.DataFrame(rows)
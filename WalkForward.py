@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from _classes.Utility import *
+from PricePanel import GetPricePanel
+from PriceSignals import GetMomentumSignals, WarnUnchecked
+from VectorBacktest import ForwardFill, RebalanceDays, VectorPortfolio
+from BaselineCache import BuyHoldFromPrices
+
+#Walk forward comparison of price momentum against BuyHold over many overlapping windows, such as a one year window starting every month.
+#All windows share one price panel, one set of signal matrices and one forward filled copy of the prices.  Picks depend only on the rebalance day,
+#so they are computed once per day and reused by every window and rebalance offset that rebalances on that day.
+#Each window is simulated like RunPriceMomentum(vectorized=True), with offset shifting the first rebalance (the ReEvaluationInterval phase), the window holds cash until then.
+#Picks always come from the PriceSignals filters, which are unchecked against StockPicker (see PriceSignals.PointValue), and every run warns so.
+startFrequencies = {'M':'MS', 'W':'W-MON', 'D':'B'}
+
+def WindowStartDates(startDate, endDate, frequency:str='M'):
+	#Window start dates from startDate to endDate, frequency is M (first of each month), W (Mondays) or D (every weekday)
+	return list(pd.date_range(ToDate(startDate), ToDate(endDate), freq=startFrequencies.get(frequency, frequency)))
+
+class WalkForward():
+	def __init__(self, tickerList:list, longHistory:int=365, shortHistory:int=90, baselineTicker:str='.INX'):
+		self.panel = panel = GetPricePanel(list(tickerList) + [baselineTicker])
+		self.baselineTicker = baselineTicker
+		self.signals = GetMomentumSignals(panel, longHistory, shortHistory)
+		WarnUnchecked('WalkForward')
+		self.universe = np.zeros(len(panel.tickers), dtype=bool)
+		for t in tickerList:
+			if panel.TickerIndex(t) >= 0: self.universe[panel.TickerIndex(t)] = True
+		self.close = ForwardFill(panel.fields['Close'])
+		openPrices = np.nan_to_num(panel.fields['Open'], nan=0.0)
+		self.openPrices = np.where(openPrices > 0, openPrices, self.close)
+		self._picks = {}
+
+	def Picks(self, day:int, stockCount:int, filterOption:int, minPercentGain:float):
+		#Ticker indexes bought on a rebalance day, in ticker order like the TargetHoldings groupby
+		key = (day, stockCount, filterOption, minPercentGain)
+		if not key in self._picks:
+			selected = self.signals.Select(day, stockCount, filterOption, minPercentGain, self.universe)
+			self._picks[key] = sorted(selected, key=lambda i: self.panel.tickers[i])
+		return self._picks[key]
+
+	def RunWindow(self, startDate, durationInYears:int=1, offset:int=0, stockCount:int=9, ReEvaluationInterval:int=20, filterOption:int=3, minPercentGain:float=0.05, portfolioSize:float=30000):
+		#Ending value of one window, 0 when there are no prices for it
+		i0, i1 = self.panel.DateRange(startDate, AddDays(ToDate(startDate), 365 * durationInYears))
+		if i1 - i0 < 2: return 0
+		portfolio = VectorPortfolio(self.panel.tickers, self.panel.dates[i0:i1], self.close[:, i0:i1], self.openPrices[:, i0:i1], portfolioSize, portfolioSize/stockCount)
+		for day in RebalanceDays(i1 - i0, ReEvaluationInterval, offset):
+			portfolio.SellAll(day)
+			picks = self.Picks(i0 + day, stockCount, filterOption, minPercentGain)
+			portfolio.BuyIndexes(day, picks, np.ones(len(picks)))
+		portfolio.SellAll(i1 - i0 - 1)
+		return portfolio.cash
+
+	def Run(self, startDate, endDate, durationInYears:int=1, frequency:str='M', offsets:list=None, stockCount:int=9, ReEvaluationInterval:int=20, filterOption:int=3, minPercentGain:float=0.05, portfolioSize:float=30000):
+		#One row per window start and offset for windows that end before the prices do, Difference is the model gain minus the BuyHold gain
+		if offsets is None: offsets = [0]
+		lastDate = pd.Timestamp(self.panel.dates[-1])
+		rows = []
+		for windowStart in WindowStartDates(startDate, endDate, frequency):
+			if AddDays(windowStart, 365 * durationInYears) > lastDate: break
+			m1ev = BuyHoldFromPrices(self.panel, self.baselineTicker, windowStart, durationInYears, portfolioSize)
+			for offset in offsets:
+				m2ev = self.RunWindow(windowStart, durationInYears, offset, stockCount, ReEvaluationInterval, filterOption, minPercentGain, portfolioSize)
+				m1pg = (m1ev/portfolioSize) - 1
+				m2pg = (m2ev/portfolioSize) - 1
+				rows.append((windowStart, offset, durationInYears, m1ev, m2ev, m1pg, m2pg, m2pg-m1pg))
+		return pd.DataFrame(rows, columns=['StartDate','Offset','Duration','BuyHoldEndingValue','ModelEndingValue','BuyHoldGain','ModelGain','Difference'])
+
+def SummarizeWalkForward(results:pd.DataFrame):
+	#Distribution of Difference overall and for each rebalance offset
+	def Describe(differences):
+		return pd.Series({'Windows':len(differences), 'Mean':differences.mean(), 'Std':differences.std(), 'Min':differences.min(), 'P5':differences.quantile(.05), 'P25':differences.quantile(.25), 'Median':differences.median(), 'P75':differences.quantile(.75), 'P95':differences.quantile(.95), 'Max':differences.max(), 'Beat':(differences > 0).mean()})
+	summary = {'All':Describe(results['Difference'])}
+	if results['Offset'].nunique() > 1:
+		for offset, group in results.groupby('Offset'): summary['Offset ' + str(offset)] = Describe(group['Difference'])
+	return pd.DataFrame(summary).T
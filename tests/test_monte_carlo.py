@@ -0,0 +1,35 @@
+import os, sys
+import pytest
+repositoryFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repositoryFolder)
+pytest.importorskip('_classes.PriceTradeAnalyzer')
+from _classes.TickerLists import TickerLists
+import PricePanel, MonteCarlo
+from PricePanel import historicalFolder
+from MonteCarlo import VerifyMonteCarlo
+from Benchmark import GenerateSyntheticHistory
+
+#Historical Monte Carlo scenarios with offset 0 and the whole universe have to end with the same model and BuyHold values as WalkForward.RunWindow
+#and BuyHoldFromPrices from the same start date.  Both run on synthetic SPTop70 histories generated in a temporary folder, some tickers list late or delist early
+
+@pytest.fixture(scope='module')
+def _SyntheticFolder(tmp_path_factory):
+	folder = tmp_path_factory.mktemp('montecarlo')
+	startingFolder = os.getcwd()
+	os.chdir(folder)
+	try:
+		GenerateSyntheticHistory(TickerLists.SPTop70() + ['.INX'], historicalFolder, listingSpread=True)
+	finally:
+		os.chdir(startingFolder)
+	return folder
+
+@pytest.fixture(autouse=True)
+def _WorkFolder(_SyntheticFolder, monkeypatch):
+	monkeypatch.chdir(_SyntheticFolder)
+	monkeypatch.setattr(PricePanel, '_panels', {}) #Panels mapped from other folders are not reused
+	monkeypatch.setattr(MonteCarlo, '_history', None)
+
+@pytest.mark.parametrize('durationInYears, ReEvaluationInterval, filterOption, longHistory, shortHistory', [(1, 20, 3, 365, 90), (2, 15, 1, 365, 30), (1, 7, 4, 120, 60)])
+def test_HistoricalScenariosMatchWalkForward(durationInYears, ReEvaluationInterval, filterOption, longHistory, shortHistory):
+	mismatches = VerifyMonteCarlo(TickerLists.SPTop70(), scenarios=25, durationInYears=durationInYears, ReEvaluationInterval=ReEvaluationInterval, filterOption=filterOption, longHistory=longHistory, shortHistory=shortHistory, seed=durationInYears)
+	assert mismatches == []
@@ -0,0 +1,34 @@
+import os, sys
+import pytest
+repositoryFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repositoryFolder)
+pytest.importorskip('_classes.PriceTradeAnalyzer')
+from _classes.TickerLists import TickerLists
+import PricePanel
+from PricePanel import historicalFolder
+from PriceSignals import VerifySignalPicker
+from Benchmark import GenerateSyntheticHistory
+
+#SignalPicker has to pick the same tickers with the same longHistoryPC, shortHistoryPC and Point_Value as StockPicker on every rebalance day and for every filter option.
+#Both pickers run on synthetic SPTop70 histories generated in a temporary folder, some tickers list late or delist early
+
+@pytest.fixture(scope='module')
+def _SyntheticFolder(tmp_path_factory):
+	folder = tmp_path_factory.mktemp('signals')
+	startingFolder = os.getcwd()
+	os.chdir(folder)
+	try:
+		GenerateSyntheticHistory(TickerLists.SPTop70() + ['.INX'], historicalFolder, listingSpread=True)
+	finally:
+		os.chdir(startingFolder)
+	return folder
+
+@pytest.fixture(autouse=True)
+def _WorkFolder(_SyntheticFolder, monkeypatch):
+	monkeypatch.chdir(_SyntheticFolder)
+	monkeypatch.setattr(PricePanel, '_panels', {}) #Panels mapped from other folders are not reused
+
+@pytest.mark.parametrize('longHistory, shortHistory, minPercentGain', [(365, 90, 0.05), (365, 30, 0.05), (120, 60, 0.05), (365, 90, 0.12)])
+def test_SignalPickerMatchesStockPicker(longHistory, shortHistory, minPercentGain):
+	mismatches = VerifySignalPicker(TickerLists.SPTop70(), startDate='1/1/1990', endDate='1/1/2018', ReEvaluationInterval=20, longHistory=longHistory, shortHistory=shortHistory, minPercentGain=minPercentGain)
+	assert mismatches == []
@@ -0,0 +1,40 @@
+import os, sys
+import pytest
+import numpy as np
+import pandas as pd
+repositoryFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repositoryFolder)
+from VectorBacktest import VectorPortfolio, MeasureTolerance, dailyValueTolerance, tradeTolerance, endToEndTolerance
+
+#VectorPortfolio has to fill the rebalances of the TradingModel logs in Data/ within the tolerances VectorBacktest states, for the daily values and the trades,
+#and a whole log replayed from its starting cash has to stay within endToEndTolerance.
+
+@pytest.fixture(autouse=True)
+def _RepositoryFolder(monkeypatch): monkeypatch.chdir(repositoryFolder)
+
+def test_ReplayedLogsWithinTolerance():
+	differences = MeasureTolerance('Data/')
+	assert len(differences) > 0
+	assert (differences['unmatched'] == 0).all() and (differences['dates'] == 0).all()
+	assert (differences['dailyValue'] <= dailyValueTolerance).all()
+	assert (differences[['units','prices']].max(axis=1) <= tradeTolerance).all()
+
+def test_ReplayedLogsFromStartingCashWithinTolerance():
+	differences = MeasureTolerance('Data/', fromLogCash=False)
+	assert len(differences) > 0
+	assert (differences['dailyValue'] <= endToEndTolerance).all()
+
+def test_RepeatedTickerTradesAddUpToTotalValue():
+	#BuyHoldStrategy orders the same ticker ten times without aligning positions, every tranche has to be sold and show up in the trades
+	rng = np.random.default_rng(0)
+	days = 60
+	close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, (2, days)), axis=1))
+	openPrices = close * np.exp(rng.normal(0, 0.005, (2, days)))
+	portfolio = VectorPortfolio(['AAA','BBB'], pd.bdate_range('1/2/2020', periods=days).values, close, openPrices, 30000, 3000)
+	portfolio.BuyIndexes(0, [0] * 10, [1] * 10)
+	portfolio.SellAll(20)
+	portfolio.BuyIndexes(20, [1, 0, 1], [1, 1, 1])
+	portfolio.SellAll(days - 1)
+	trades = portfolio.TradeHistory()
+	assert (trades['ticker'] == 'AAA').sum() >= 10
+	assert portfolio.cash == pytest.approx(30000 + trades['NetChange'].sum())